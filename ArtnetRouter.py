@@ -1,11 +1,17 @@
+import copy
 import logging
-import time
+import queue
 import socket
 
 from ArtnetServer import ArtnetServer
-from ArtnetUtils import time_in_millis, decode_address_int
+from AsyncOutputEngine import AsyncOutputEngine
+from ArtnetUtils import time_in_millis, decode_address_int, getParam
 from ConfigParser import ConfigParser
+from DisplayDevice import DisplayDevice
+from OutputWorkers import OutputWorkerPool
+from PixelblazeEnumerator import PixelblazeEnumerator
 from ProjectData import ProjectData
+from SacnServer import SacnServer
 
 
 class ArtnetRouter:
@@ -14,6 +20,10 @@ class ArtnetRouter:
     process, and communicate with the main process via Queues.
     """
     receiver = None
+    sacnReceiver = None
+    outputEngine = None
+    workers = None
+    enumerator = None
     pixelsPerUniverse = 170
     pixelCount = 0
     dataReady = False
@@ -21,9 +31,11 @@ class ArtnetRouter:
     FrameCount = 0
     delay = 0.033333  # default to 30 fps outgoing limit
     notify_ms = 3000  # status update to UI/log every 3 seconds by default
+    IDLE_STATUS_FACTOR = 4  # when every device is idle and the UI isn't watching, update status less often
 
     config = None
     universes = []
+    routes = None
     deviceList = None
     pollReplyPacket = None
 
@@ -36,12 +48,31 @@ class ArtnetRouter:
             datefmt='%Y-%m-%d %H:%M:%S')
 
         self.pd = pd
-        self.dataQueue = pd.dataQueue
+        self.statusBoard = pd.statusBoard
         self.ui_is_active = pd.ui_is_active
         self.exit_flag = pd.exit_flag
+        self.cmdQueue = pd.cmdQueue
 
+        # with output workers, our devices only receive data. The workers send it.
+        liveConfig = pd.liveConfig
+        workerCount = getParam(getParam(liveConfig, "system", dict()), "outputWorkers", 0)
+        if workerCount > 0:
+            liveConfig = copy.deepcopy(liveConfig)
+            liveConfig["system"]["outputEngine"] = "workers"
+
+        self.liveConfig = liveConfig
         jim = ConfigParser()
-        self.config, self.deviceList, self.universes = jim.parse(pd.liveConfig)
+        self.config, self.deviceList, self.universes = jim.parse(liveConfig)
+        self.routes = jim.getRoutingTable()
+
+        if workerCount > 0:
+            self.workers = OutputWorkerPool(pd.liveConfig, self.deviceList, workerCount, pd)
+
+        # in asyncio mode, a single event loop runs all the devices
+        elif getParam(self.config, "outputEngine", "threads") == "asyncio":
+            self.outputEngine = AsyncOutputEngine()
+            for key in self.deviceList:
+                self.outputEngine.addDevice(self.deviceList[key])
 
         if self.config['ipArtnet'] == "0.0.0.0":
             print("Listening for Art-Net on all interfaces at port %s" % self.config['portArtnet'])
@@ -53,8 +84,21 @@ class ArtnetRouter:
         # to Pixelblazes
         self.pollReplyPacket = self.createPollReplyPacket(self.config['ipArtnet'], self.config['portArtnet'])
         self.receiver = ArtnetServer(self.config["ipArtnet"], self.config["portArtnet"], self.pollReplyPacket,
-                                     self.main_dispatcher)
-        sleep_time = self.config['statusUpdateIntervalMs'] / 1000
+                                     self.main_dispatcher, self.routes,
+                                     getParam(self.config, "zeroCopyReceive", True),
+                                     self.sync_dispatcher)
+
+        # optionally, listen for sACN on the same universes, feeding the same dispatcher
+        if getParam(self.config, "sacnEnabled", False):
+            print("Listening for sACN on port %s" % self.config['portSacn'])
+            self.sacnReceiver = SacnServer(self.config["ipArtnet"], self.config["portSacn"], self.routes,
+                                           self.main_dispatcher,
+                                           getParam(self.config, "zeroCopyReceive", True),
+                                           self.sync_dispatcher)
+
+        # listen for Pixelblaze beacons, so we can reconnect to devices as soon as they reappear
+        if getParam(self.config, "listenForBeacons", True):
+            self.enumerator = PixelblazeEnumerator(beaconCallback=self.beacon_dispatcher)
 
         # Periodically send updated status information to the UI queue, where
         # the WebUI can display it if anybody's watching.  We try to keep
@@ -65,15 +109,32 @@ class ArtnetRouter:
                 if self.exit_flag.is_set():
                     break
 
-                time.sleep(sleep_time)
+                # wait for the next status update, handling commands from the main process
+                # as they arrive.  If nothing's happening and nobody's watching, check in less
+                # often -- the UI lets us know when it becomes active.
+                sleep_time = self.config['statusUpdateIntervalMs'] / 1000
+                if not self.ui_is_active.is_set() and self.all_idle():
+                    sleep_time *= self.IDLE_STATUS_FACTOR
+                self.processCommands(sleep_time)
+                if self.exit_flag.is_set():
+                    break
                 elapsedTime = time_in_millis() - self.notifyTimer
 
-                for key in self.deviceList:
+                # post status to the status board.  Output workers post their own devices' status.
+                uiActive = self.ui_is_active.is_set()
+                self.statusBoard.set_device_count(len(self.deviceList))
+                for slot, key in enumerate(self.deviceList):
                     dd = self.deviceList[key]
-                    if self.ui_is_active.is_set():
-                        self.dataQueue.put(dd.getStatusString(elapsedTime / 1000))
+                    if uiActive and self.workers is None:
+                        self.statusBoard.set_device(slot, dd.getStatus(elapsedTime / 1000))
                     dd.resetCounters()
 
+                # per-universe sequence statistics from the receiver
+                universeStats = self.getUniverseStatistics()
+                if uiActive:
+                    self.statusBoard.set_universes(universeStats)
+                    self.statusBoard.mark_updated()
+
                 self.notifyTimer = time_in_millis()
 
             except KeyboardInterrupt:
@@ -93,27 +154,120 @@ class ArtnetRouter:
         self.notify_ms = max(500, ms)  # min interval is 1/2 second, default should be about 3 sec
 
     def shutdown(self):
-        # stop all devices in DeviceList
-        for key in self.deviceList:
-            logging.info("Stopping device: " + self.deviceList[key].name)
-            self.deviceList[key].stop()
+        if self.enumerator is not None:
+            logging.debug("Stopping Pixelblaze beacon listener")
+            self.enumerator.stop()
+
+        if self.outputEngine is not None:
+            logging.debug("Stopping async output engine")
+            self.outputEngine.stop()
+
+        if self.workers is not None:
+            logging.debug("Stopping output workers")
+            self.workers.stop()
+
+        # stop all devices in DeviceList, closing their connections in parallel
+        logging.info("Stopping devices: " + ", ".join(self.deviceList[key].name for key in self.deviceList))
+        DisplayDevice.stop_all(self.deviceList.values())
 
         # stop listening for Artnet packets
         logging.debug("Stopping Artnet receiver thread")
-        del self.receiver
+        self.receiver.close()
+        if self.sacnReceiver is not None:
+            logging.debug("Stopping sACN receiver thread")
+            self.sacnReceiver.close()
+
+    def processCommands(self, timeout: float):
+        """
+        Wait up to timeout seconds for commands from the main process, and handle
+        whatever's arrived.  Any command wakes us up, so "stop" and "uiActive" just
+        get us back to the main loop to check the flags.
+        """
+        try:
+            cmd = self.cmdQueue.get(timeout=timeout)
+        except queue.Empty:
+            return
+
+        while True:
+            if "reloadConfig" in cmd:
+                self.reloadConfig(cmd["reloadConfig"])
+            try:
+                cmd = self.cmdQueue.get_nowait()
+            except queue.Empty:
+                return
+
+    def reloadConfig(self, newConfig: dict):
+        """
+        Switch to a new configuration without restarting.  Devices whose settings haven't
+        changed keep running, and keep their connections.  Others are stopped, or created.
+        Settings that can't be changed on the fly are handled by restarting the router
+        instead -- see ConfigParser.requiresRestart().
+        """
+        keep = dict()
+        for key in ConfigParser.unchangedDevices(self.liveConfig, newConfig):
+            keep[key] = self.deviceList[key]
+
+        jim = ConfigParser()
+        config, deviceList, universes = jim.parse(newConfig, keep)
+        routes = jim.getRoutingTable()
+
+        # switch over.  The dispatchers pick up the new routes and devices with their next packet.
+        oldDevices = self.deviceList
+        self.routes = routes
+        self.receiver.setSubscribed(routes)
+        if self.sacnReceiver is not None:
+            self.sacnReceiver.setSubscribed(routes)
+        self.config, self.deviceList, self.universes = config, deviceList, universes
+        self.liveConfig = newConfig
+
+        # start the new devices, and stop the ones we're not using anymore
+        kept = set(keep.values())
+        if self.outputEngine is not None:
+            for key in deviceList:
+                if deviceList[key] not in kept:
+                    self.outputEngine.addDevice(deviceList[key])
+        stopped = [oldDevices[key] for key in oldDevices if oldDevices[key] not in kept]
+        if self.outputEngine is not None:
+            for dev in stopped:
+                self.outputEngine.removeDevice(dev)
+        DisplayDevice.stop_all(stopped)
+
+        logging.info("Configuration reloaded: kept %d devices, started %d, stopped %d" %
+                     (len(kept), len(deviceList) - len(kept), len(stopped)))
 
     def main_dispatcher(self, addr, data):
         """Receives data from server callback and dispatches it to display devices."""
         # universe, subnet, net = decode_address_int(addr)
         # print("%d, subnet %d, net %d" % (universe, subnet, net))
 
-        # test against the universe fragments in universes and print any matches
-        for key in self.universes:
-            u = self.universes[key]
-            for k in u:
-                if k.address_mask == addr:
-                    # Art-Net datagram size - 512 bytes of data plus 60 bytes of header
-                    k.device.process_packet(data, k.startChannel, k.destIndex, k.pixelCount)
+        # look up the prebound handlers for every fragment that wants this universe
+        handlers = self.routes.get(addr)
+        if handlers is None:
+            return
+
+        for handler in handlers:
+            handler(data)
+
+    def all_idle(self) -> bool:
+        """Returns True if every device is idle.  With output workers, the workers know which devices are idle."""
+        if self.workers is not None:
+            return self.workers.all_idle()
+        return all(self.deviceList[key].idle for key in self.deviceList)
+
+    def beacon_dispatcher(self, ip: str):
+        """Receives Pixelblaze beacon notifications from the enumerator, and lets the matching devices know."""
+        if self.workers is not None:
+            # the workers run the connections
+            self.workers.beacon_seen(ip)
+            return
+        for dev in self.deviceList.values():
+            if dev.ip == ip:
+                dev.beacon_seen()
+
+    def sync_dispatcher(self):
+        """Receives ArtSync notifications from the server and tells every device to latch its frame."""
+        for dev in self.deviceList.values():
+            dev.sync()
 
     # use each universe's str() method to convert the printable data in self.universes into a JSON string
     # by calling the __str__ method of each UniverseFragment in the list, and concatenating the results
@@ -144,6 +298,30 @@ class ArtnetRouter:
         result += "}}"
         return result
 
+    def getUniverseStatistics(self) -> dict:
+        """
+        Return per-universe packet statistics from the receivers, keyed by universe
+        address, and reset the receivers' counters.
+        """
+        universeCounts = self.receiver.getUniverseStatistics()
+
+        # combine Art-Net and sACN counts for universes that are getting both
+        if self.sacnReceiver is not None:
+            for addr, counts in self.sacnReceiver.getUniverseStatistics().items():
+                if addr in universeCounts:
+                    for key in counts:
+                        universeCounts[addr][key] += counts[key]
+                else:
+                    universeCounts[addr] = counts
+
+        for addr, counts in universeCounts.items():
+            net, subnet, universe = decode_address_int(addr)
+            counts["net"] = net
+            counts["subnet"] = subnet
+            counts["universe"] = universe
+
+        return universeCounts
+
     def createPollReplyPacket(self, listen_ip: str, udp_port: int):
         """
         Create an Art-Net PollReply packet that we can send to controllers, so
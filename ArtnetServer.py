@@ -8,9 +8,13 @@ https://github.com/cpvalente/stupidArtnet
 2/2024 ZRanger1
 """
 
+import logging
 import socket
 from threading import Thread
 
+from ArtnetUtils import wake_udp_listener
+from SequenceTracker import SequenceTracker
+
 
 class ArtnetServer:
     """
@@ -25,8 +29,19 @@ class ArtnetServer:
     UDP_PORT = 6454
     socket_server = None
     callback = None
-    sequence = 0
+    syncCallback = None
+    sequencer = None
     pollReplyPacket = None
+    subscribed = None
+
+    # Zero-copy receive mode reads packets into a small ring of preallocated buffers and hands the
+    # callback a memoryview of the DMX payload.  The view is only valid until the buffer comes
+    # around again in the ring, so callbacks must copy out whatever data they want to keep.
+    BUFFER_SIZE = 2048
+    BUFFER_POOL_SIZE = 4
+
+    # how long close() waits for the listener thread
+    SHUTDOWN_TIMEOUT = 0.5
 
     """
     Art-Net packet header to use for validation
@@ -40,14 +55,30 @@ class ArtnetServer:
     """
     ARTDMX_HEADER = b'Art-Net\x00\x00'
 
-    def __init__(self, listen_ip: str, udp_port: int, pollReplyPacket, callback):
-        """Initializes Art-Net server."""
+    # DMX data starts right after the ArtDmx header
+    ARTDMX_DATA_OFFSET = 18
+
+    def __init__(self, listen_ip: str, udp_port: int, pollReplyPacket, callback, subscribed=None,
+                 zeroCopy: bool = True, syncCallback=None):
+        """
+        Initializes Art-Net server.
+        :param subscribed: optional container of the universe addresses we route.  If
+        supplied, packets for any other universe are dropped before their data is copied.
+        :param zeroCopy: if True, receive into the buffer pool and pass memoryviews to the
+        callback.  If False, each packet's DMX data is copied into a new bytearray.
+        :param syncCallback: optional function, called with no arguments when an ArtSync
+        packet arrives.
+        """
         # server active flag
         self.listen = True
         self.callback = callback
+        self.syncCallback = syncCallback
         self.listen_ip = listen_ip
         self.UDP_PORT = udp_port
         self.pollReplyPacket = pollReplyPacket
+        self.subscribed = subscribed
+        self.zeroCopy = zeroCopy
+        self.sequencer = SequenceTracker()
 
         self.server_thread = Thread(target=self.__init_socket, daemon=True)
         self.server_thread.start()
@@ -64,30 +95,83 @@ class ArtnetServer:
         # just bind to 0.0.0.0
         self.socket_server.bind((self.listen_ip, self.UDP_PORT))  # Listen on any valid IP
 
-        while self.listen:
-
-            data, sender = self.socket_server.recvfrom(2048)
+        # set up the receive buffer pool
+        pool = [bytearray(self.BUFFER_SIZE) for _ in range(self.BUFFER_POOL_SIZE)]
+        views = [memoryview(buf) for buf in pool]
+        poolIndex = 0
 
-            # check the header -- we only support Art-Net DMX
-            if data[:9] == ArtnetServer.ARTDMX_HEADER:
-                if data[9] == 0x50:
-                    # TODO - check packet sequence number
-                    # At worst, we should track this per-universe and drop out-of-order
-                    # packets, or if the sequence number is too old, indicating an episode of very high
-                    # packet loss, restart the sequence.
-                    # Right now, we're just going to ignore the sequence number
-
-                    new_seq = data[12]
-                    old_seq = self.sequence
-                    self.sequence = new_seq
+        while self.listen:
 
-                    # pass the buffer to the callback function
-                    # for distribution to interested pixelblazes
-                    addr = int.from_bytes(data[14:16], byteorder='little')
-                    self.callback(addr, bytearray(data)[18:])
+            try:
+                if self.zeroCopy:
+                    nbytes, sender = self.socket_server.recvfrom_into(pool[poolIndex])
+                    data = views[poolIndex][:nbytes]
+                    poolIndex = (poolIndex + 1) % self.BUFFER_POOL_SIZE
+                else:
+                    data, sender = self.socket_server.recvfrom(self.BUFFER_SIZE)
+            except OSError:
+                # socket's been closed
+                break
+
+            # too short to be Art-Net. close() sends an empty packet to wake us up.
+            if len(data) < 10:
+                continue
+
+            # whatever arrives, a bad packet mustn't take the listener down with it
+            try:
+                self.process_packet(data, sender)
+            except Exception as e:
+                logging.warning("Art-Net: error processing packet from %s: %s" % (sender[0], e))
+
+    def process_packet(self, data, sender):
+        """
+        Check a packet's header and dispatch it by OpCode
+        :param data: the packet, at least 10 bytes long
+        :param sender: address the packet came from
+        """
+        # check the header -- we only support Art-Net DMX
+        if data[:9] == ArtnetServer.ARTDMX_HEADER:
+            if data[9] == 0x50:
+                if len(data) < self.ARTDMX_DATA_OFFSET:
+                    return
+
+                # drop universes nobody is listening to before we copy anything
+                addr = int.from_bytes(data[14:16], byteorder='little')
+                if self.subscribed is not None and addr not in self.subscribed:
+                    return
+
+                # drop duplicate and out-of-order packets
+                if not self.sequencer.accept(addr, data[12]):
+                    return
+
+                # pass the DMX data to the callback function
+                # for distribution to interested pixelblazes
+                if self.zeroCopy:
+                    self.callback(addr, data[self.ARTDMX_DATA_OFFSET:])
+                else:
+                    self.callback(addr, bytearray(data)[self.ARTDMX_DATA_OFFSET:])
+
+            # ArtSync - tells us to latch and display everything we've received
+            elif data[9] == 0x52:
+                if self.syncCallback is not None:
+                    self.syncCallback()
+
+        elif data[9] == 0x20:
+            self.send_artnet_poll_reply(sender)
+
+    def setSubscribed(self, subscribed):
+        """
+        Switch to a new set of universes.
+        :param subscribed: container of the universe addresses we route, or None for all
+        """
+        self.subscribed = subscribed
 
-            elif data[9] == 0x20:
-                self.send_artnet_poll_reply(sender)
+    def getUniverseStatistics(self, reset: bool = True) -> dict:
+        """
+        Returns per-universe counts of received, reordered, duplicated and lost packets
+        :param reset: if True, zero the counters after reading them
+        """
+        return self.sequencer.getStatistics(reset)
 
     def send_artnet_poll_reply(self, address):
         """
@@ -108,6 +192,13 @@ class ArtnetServer:
         return state
 
     def close(self):
-        """Close UDP socket."""
-        self.listen = False  # Set flag
-        self.server_thread.join()  # Terminate thread once jobs are complete
+        """Stop the listener thread and close the UDP socket."""
+        if not self.listen:
+            return
+        self.listen = False
+        # the thread's probably waiting for a packet, so send it one
+        if self.socket_server is not None:
+            wake_udp_listener(self.socket_server)
+        self.server_thread.join(self.SHUTDOWN_TIMEOUT)
+        if self.socket_server is not None:
+            self.socket_server.close()
@@ -8,6 +8,7 @@ ArtnetUtils.py - Provides common functions for byte objects.
 
 2/2024 ZRanger1
 """
+import socket
 import time
 
 
@@ -192,3 +193,18 @@ def time_in_millis() -> int:
     """
     return int(round(time.time() * 1000)) % 0xFFFFFFFF
 
+
+def wake_udp_listener(sock):
+    """
+    Utility Method: sends an empty datagram to a bound UDP socket, so a thread that's
+    blocked receiving on it wakes up and can see that it's time to stop.
+    """
+    try:
+        ip, port = sock.getsockname()
+        if ip in ("0.0.0.0", ""):
+            ip = "127.0.0.1"
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.sendto(b"", (ip, port))
+    except OSError:
+        # not bound yet, or already closed
+        pass
@@ -0,0 +1,224 @@
+"""
+AsyncOutputEngine - runs all of the router's DisplayDevices from a single asyncio
+event loop, in a single thread, rather than giving each device its own thread.
+
+Each device gets a task which sends frames on a fixed schedule and takes care of
+reconnecting when its Pixelblaze goes away.  Incoming websocket traffic is handled by
+socket readers registered with the loop, so nothing polls.  Connection attempts
+start with a non-blocking connect, but the websocket handshake that follows blocks in
+the websocket library, so they run in the loop's executor.
+
+Nothing on the loop may wait on a socket, or one slow Pixelblaze would hold up all the
+others.  So every device sends through its outbox, with a socket writer registered to
+finish partly sent frames as the link allows, and receives through its inbox, which
+never waits for the rest of a message.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from functools import partial
+
+from DisplayDevice import DisplayDevice
+
+
+class AsyncOutputEngine:
+    # shortest wait between reconnection attempts for a device that isn't connected.  The
+    # device's ConnectionManager backs off from there.
+    RECONNECT_INTERVAL = 0.25
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.tasks = dict()
+        self.thread = threading.Thread(target=self._run_loop, name="AsyncOutputEngine", daemon=True)
+        self.thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def addDevice(self, dev: DisplayDevice):
+        """
+        Start running a device.  Safe to call from any thread.
+        """
+        self.loop.call_soon_threadsafe(self._start_device, dev)
+
+    def removeDevice(self, dev: DisplayDevice):
+        """
+        Stop running a device.  Safe to call from any thread.
+        """
+        self.loop.call_soon_threadsafe(self._cancel_device, dev)
+
+    def _start_device(self, dev: DisplayDevice):
+        if dev not in self.tasks:
+            dev.use_nonblocking_io()
+            self.tasks[dev] = self.loop.create_task(self._run_device(dev))
+
+    def _cancel_device(self, dev: DisplayDevice):
+        task = self.tasks.pop(dev, None)
+        if task is not None:
+            task.cancel()
+
+    def _receive(self, dev: DisplayDevice, sock):
+        """
+        Socket reader callback: handle whatever the Pixelblaze sent us.
+        """
+        try:
+            dev.receive_available()
+            self._watch_output(dev, sock)
+        except Exception as e:
+            self._drop_connection(dev, sock, e)
+
+    def _send(self, dev: DisplayDevice, sock):
+        """
+        Socket writer callback: the socket has room, so send more of the outbox
+        """
+        try:
+            dev.flush_output()
+            if not dev.outbox.has_output():
+                self.loop.remove_writer(sock)
+        except Exception as e:
+            self._drop_connection(dev, sock, e)
+
+    def _drop_connection(self, dev: DisplayDevice, sock, e: Exception):
+        """
+        Stop watching a dead connection, and wake the device's task so it can reconnect
+        """
+        self._unwatch(sock)
+        dev.connection_lost(e)
+        if dev.wakeSender is not None:
+            dev.wakeSender()
+
+    def _watch_output(self, dev: DisplayDevice, sock):
+        """
+        If there's output the socket couldn't take yet, send it as soon as there's room
+        """
+        if dev.outbox.has_output():
+            self.loop.add_writer(sock, self._send, dev, sock)
+
+    def _unwatch(self, sock):
+        if sock is not None:
+            for remove in (self.loop.remove_reader, self.loop.remove_writer):
+                try:
+                    remove(sock)
+                except (ValueError, OSError):
+                    # socket was already closed
+                    pass
+
+    async def _run_device(self, dev: DisplayDevice):
+        """
+        Open a device's Pixelblaze and maintain the connection, sending frames at the
+        device's frame rate.
+        """
+        await self.loop.run_in_executor(None, dev.open_pixelblaze)
+
+        sock = None
+        dev.scheduler.reset()
+
+        # the receiver wakes us up when data arrives while we're idle, or
+        # (in send-on-frame-complete mode) when a frame is complete
+        wake = asyncio.Event()
+        dev.wakeSender = partial(self.loop.call_soon_threadsafe, wake.set)
+        try:
+            while dev.run_flag.is_set():
+                try:
+                    if dev.pb.is_connected():
+                        # watch the new socket if we've (re)connected
+                        if sock is not dev.pb.ws.sock:
+                            self._unwatch(sock)
+                            sock = dev.pb.ws.sock
+                            self.loop.add_reader(sock, self._receive, dev, sock)
+
+                        # if we're idle, there's no frame deadline. Wait 'till the receiver wakes us up.
+                        if dev.check_idle():
+                            wake.clear()
+                            if dev.idle:
+                                await wake.wait()
+                            dev.scheduler.reset()
+                            continue
+
+                        # sleep 'till it's time to send a frame, or we're woken up by a completed
+                        # frame. If we've fallen behind, the scheduler skips the missed frames
+                        # rather than trying to catch up.
+                        wait = dev.time_until_send()
+                        if wait > 0:
+                            wake.clear()
+                            try:
+                                await asyncio.wait_for(wake.wait(), wait)
+                            except asyncio.TimeoutError:
+                                pass
+                            if dev.time_until_send() > 0:
+                                continue
+
+                        # send any data we've received
+                        dev.send_next_frame()
+                        self._watch_output(dev, sock)
+                    else:
+                        self._unwatch(sock)
+                        sock = None
+                        await self._reconnect(dev, wake)
+                        dev.scheduler.reset()
+
+                except asyncio.CancelledError:
+                    raise
+
+                except Exception as e:
+                    self._unwatch(sock)
+                    sock = None
+                    dev.connection_lost(e)
+        finally:
+            dev.wakeSender = None
+            self._unwatch(sock)
+
+    async def _reconnect(self, dev: DisplayDevice, wake: asyncio.Event):
+        """
+        Wait, on the loop, 'till a connection attempt is due or the one in progress has
+        something to report, and only then go to the executor to start or finish it.
+        """
+        pb = dev.pb
+        if pb.is_connecting():
+            # wait for the TCP connection to come up (or fail), but not past the connect timeout
+            timeout = dev.connectStarted + pb.default_connect_timeout - time.monotonic()
+            if timeout > 0:
+                await self._wait_writable(pb.pendingSocket, timeout)
+        else:
+            # wait out the backoff.  Hearing a beacon from the Pixelblaze wakes us up early.
+            wake.clear()
+            try:
+                await asyncio.wait_for(wake.wait(), max(self.RECONNECT_INTERVAL, dev.connection.retry_delay()))
+            except asyncio.TimeoutError:
+                pass
+            if not dev.connection.ready():
+                return
+
+        await self.loop.run_in_executor(None, dev.reconnect)
+
+    async def _wait_writable(self, sock, timeout: float):
+        """
+        Wait 'till a socket is writable, or the timeout runs out
+        """
+        writable = self.loop.create_future()
+        self.loop.add_writer(sock, lambda: writable.done() or writable.set_result(None))
+        try:
+            await asyncio.wait_for(writable, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._unwatch(sock)
+
+    def stop(self):
+        """
+        Cancel all device tasks and shut down the event loop.
+        """
+        async def _shutdown():
+            tasks = list(self.tasks.values())
+            self.tasks.clear()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.loop.stop()
+
+        asyncio.run_coroutine_threadsafe(_shutdown(), self.loop)
+        self.thread.join()
+        logging.debug("Async output engine stopped")
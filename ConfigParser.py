@@ -7,18 +7,30 @@ import logging
 import sys
 
 from DisplayDevice import DisplayDevice
+from MirrorGroup import MirrorGroup
 from Universe import *
 
 
 class ConfigParser:
-    deviceList = dict()
-    universes = dict()
-    systemSettings = dict()
+    # system settings the router can only pick up by restarting
+    RESTART_SETTINGS = ("ipArtnet", "portArtnet", "zeroCopyReceive", "sacnEnabled", "portSacn",
+                        "outputEngine", "outputWorkers", "listenForBeacons")
+    # system settings that don't affect devices
+    ROUTER_SETTINGS = RESTART_SETTINGS + ("statusUpdateIntervalMs", "ipWebInterface", "portWebInterface")
 
-    def parseDeviceInfo(self, config):
+    def __init__(self):
+        # each parser builds its own device and universe lists
+        self.deviceList = dict()
+        self.universes = dict()
+        self.systemSettings = dict()
+        self.mirrorGroups = dict()
+
+    def parseDeviceInfo(self, config, keep: dict = None):
         """
         Extract device and universe data from the configuration dictionary and
         create DisplayDevice objects for each device.
+        :param keep: optional dictionary of existing DisplayDevice objects to reuse instead
+        of creating new ones, keyed like the config's devices
         """
 
         # process our list of Pixelblazes
@@ -27,33 +39,141 @@ class ConfigParser:
             logging.debug("No output devices found in config file.")
             devices = dict()
 
+        self.mirrorGroups = dict()
+
             # parse device record and add to hardware device list
         for key in devices:
-            dev = DisplayDevice(getParam(devices, key), self.systemSettings)
+            dev = None if keep is None else keep.get(key)
+            if dev is None:
+                dev = DisplayDevice(getParam(devices, key), self.systemSettings)
+            dev.begin_routing()
             self.deviceList[key] = dev
 
-            self.getDeviceUniverses(dev, devices[key])
+            fragments = self.getDeviceUniverses(dev, devices[key])
+
+            # members of a mirror group get their data from the group's leader, so
+            # only the leader's fragments are routed.
+            groupName = getParam(devices[key], "group", "")
+            if groupName != "":
+                group = self.mirrorGroups.get(groupName)
+                if group is None:
+                    if dev.transport == "delta":
+                        logging.warning("%s: mirror groups don't support delta transport" % dev.name)
+                    else:
+                        self.mirrorGroups[groupName] = MirrorGroup(groupName, dev)
+                        group = self.mirrorGroups[groupName]
+                        group.mapping = self.getFragmentMapping(fragments)
+                elif self.canMirror(group, dev, fragments):
+                    group.add(dev)
+                    continue
+                else:
+                    logging.warning("%s: can't join mirror group '%s' -- its settings or universe mapping "
+                                    "don't match the group's" % (dev.name, groupName))
+
+            self.addUniverseFragments(fragments)
 
-    def getDeviceUniverses(self, device, config):
+        # now that everything's built, switch the devices over to it
+        for dev in self.deviceList.values():
+            dev.commit_routing()
+
+    @staticmethod
+    def getFragmentMapping(fragments: list) -> list:
+        """
+        Returns a list that identifies a set of fragments' universe mapping, for comparison
+        """
+        return sorted((f.address_mask, f.startChannel, f.destIndex, f.pixelCount) for f in fragments)
+
+    def canMirror(self, group: MirrorGroup, device, fragments: list) -> bool:
+        """
+        Returns True if a device shows exactly what the group's leader shows, the same way
+        """
+        leader = group.leader
+        return (device.deviceStyle == leader.deviceStyle and
+                device.pixelCount == leader.pixelCount and
+                device.encoding == leader.encoding and
+                device.transport != "delta" and
+                self.getFragmentMapping(fragments) == group.mapping)
+
+    def getDeviceUniverses(self, device, config) -> list:
         """
         Extract universe data for a given device from the configuration dictionary
-        and add it to the device's universe list
         :param device: DisplayDevice object for this device
         :param config: dictionary containing universe info for the given device
+        :return: list of the device's universe fragments
         """
         # get key to universe fragments for this device
         data = getParam(config, "data",dict())
         #if data is None:
             #return None
 
-        for key in data:
-            fragment = UniverseFragment(device, getParam(data, key))
+        return [UniverseFragment(device, getParam(data, key)) for key in data]
 
+    def addUniverseFragments(self, fragments: list):
+        """
+        Add universe fragments to the universe lists used for routing
+        """
+        for fragment in fragments:
             if keyExists(self.universes, fragment.address_mask):
                 self.universes[fragment.address_mask].append(fragment)
             else:
                 self.universes[fragment.address_mask] = [fragment]
 
+    def getRoutingTable(self):
+        """
+        Compile the universe fragment lists into a routing table that maps each
+        Art-Net address to an immutable tuple of prebound fragment handlers.  Dispatch
+        then becomes a single dictionary lookup per packet.
+        :return: dictionary of address_mask -> tuple of handlers
+        """
+        routes = dict()
+        for key in self.universes:
+            routes[key] = tuple(fragment.handler for fragment in self.universes[key])
+        return routes
+
+    @staticmethod
+    def requiresRestart(oldConfig: dict, newConfig: dict) -> bool:
+        """
+        Returns True if the router has to be restarted to switch from one configuration
+        to another, rather than reloading the new one in place
+        """
+        oldSystem = getParam(oldConfig, "system", dict())
+        newSystem = getParam(newConfig, "system", dict())
+        if getParam(oldSystem, "outputWorkers", 0) > 0 or getParam(newSystem, "outputWorkers", 0) > 0:
+            # workers run their own copies of the devices
+            return True
+        return any(getParam(oldSystem, key) != getParam(newSystem, key) for key in ConfigParser.RESTART_SETTINGS)
+
+    @staticmethod
+    def unchangedDevices(oldConfig: dict, newConfig: dict) -> list:
+        """
+        Returns the keys of devices whose settings are the same in both configurations, so a
+        reload can keep them running.  Mirror groups are kept only if none of their members changed.
+        """
+        oldSystem = getParam(oldConfig, "system", dict())
+        newSystem = getParam(newConfig, "system", dict())
+        for key in set(oldSystem) | set(newSystem):
+            if key not in ConfigParser.ROUTER_SETTINGS and getParam(oldSystem, key) != getParam(newSystem, key):
+                # devices pick up their defaults from the system settings
+                return []
+
+        oldDevices = getParam(oldConfig, "devices", dict())
+        newDevices = getParam(newConfig, "devices", dict())
+        unchanged = [key for key in newDevices if key in oldDevices and oldDevices[key] == newDevices[key]]
+
+        # the first device in a group is its leader, so membership and order both matter
+        def members(devices, name):
+            return [k for k in devices if getParam(devices[k], "group", "") == name]
+
+        for key in list(unchanged):
+            name = getParam(newDevices[key], "group", "")
+            if name == "":
+                continue
+            group = members(newDevices, name)
+            if group != members(oldDevices, name) or not all(k in unchanged for k in group):
+                unchanged.remove(key)
+
+        return unchanged
+
     @staticmethod
     def setSystemDefaults(data: dict):
         """
@@ -67,6 +187,20 @@ class ConfigParser:
         data["system"]["pixelsPerUniverse"] = getParam(data["system"], "pixelsPerUniverse", 170)
         data["system"]["ipArtnet"] = getParam(data["system"], "ipArtnet", "0.0.0.0")
         data["system"]["portArtnet"] = getParam(data["system"], "portArtnet", 6454)
+        data["system"]["zeroCopyReceive"] = getParam(data["system"], "zeroCopyReceive", True)
+        data["system"]["sacnEnabled"] = getParam(data["system"], "sacnEnabled", False)
+        data["system"]["portSacn"] = getParam(data["system"], "portSacn", 5568)
+        data["system"]["outputEngine"] = getParam(data["system"], "outputEngine", "threads")
+        data["system"]["adaptiveFps"] = getParam(data["system"], "adaptiveFps", False)
+        data["system"]["nonBlockingSend"] = getParam(data["system"], "nonBlockingSend", False)
+        data["system"]["sendBufferBytes"] = getParam(data["system"], "sendBufferBytes", 0)
+        data["system"]["latencyBudgetMs"] = getParam(data["system"], "latencyBudgetMs", 0)
+        data["system"]["listenForBeacons"] = getParam(data["system"], "listenForBeacons", True)
+        data["system"]["sendOnFrameComplete"] = getParam(data["system"], "sendOnFrameComplete", False)
+        data["system"]["idleTimeoutSec"] = getParam(data["system"], "idleTimeoutSec", 10)
+        data["system"]["suppressUnchanged"] = getParam(data["system"], "suppressUnchanged", True)
+        data["system"]["keepaliveMs"] = getParam(data["system"], "keepaliveMs", 1000)
+        data["system"]["outputWorkers"] = getParam(data["system"], "outputWorkers", 0)
         data["system"]["ipWebInterface"] = getParam(data["system"], "ipWebInterface", "127.0.0.1")
         data["system"]["portWebInterface"] = getParam(data["system"], "portWebInterface", 8081)
         data["devices"] = getParam(data, "devices", dict())
@@ -108,9 +242,11 @@ class ConfigParser:
         except Exception as e:
             logging.error("Error writing config file %s: %s" % (fileName, str(e)))
 
-    def parse(self, data: dict):
+    def parse(self, data: dict, keep: dict = None):
         """
         Parse and validate configuration data from a loaded JSON blob
+        :param keep: optional dictionary of existing DisplayDevice objects to reuse, keyed
+        like the config's devices.  See unchangedDevices().
         """
 
         if data is None:
@@ -118,6 +254,6 @@ class ConfigParser:
             sys.exit()
 
         self.systemSettings = getParam(data, "system")
-        self.parseDeviceInfo(data)
+        self.parseDeviceInfo(data, keep)
 
         return self.systemSettings, self.deviceList, self.universes
@@ -0,0 +1,57 @@
+"""
+ConnectionManager.py - Decides when a display device should try to (re)connect
+to its Pixelblaze.
+
+Failed attempts back off exponentially, with some random jitter so a room full
+of Pixelblazes that all went away at once don't all come knocking at the same
+moment.  A powered-off Pixelblaze costs next to nothing.  When we hear a beacon
+from the Pixelblaze, we know it's back, so we try again right away rather than
+waiting out the backoff.
+"""
+import random
+import time
+
+
+class ConnectionManager:
+    BASE_DELAY = 0.25  # seconds
+    MAX_DELAY = 30.0  # seconds
+    JITTER = 0.5  # delays are randomly shortened by up to this fraction
+
+    def __init__(self):
+        self.failures = 0
+        self.nextAttempt = 0.0
+
+    def ready(self) -> bool:
+        """
+        Returns True if it's time to try connecting again
+        """
+        return time.monotonic() >= self.nextAttempt
+
+    def failed(self):
+        """
+        Record a failed connection attempt, and schedule the next one
+        """
+        delay = min(self.MAX_DELAY, self.BASE_DELAY * (2 ** self.failures))
+        delay *= 1.0 - self.JITTER * random.random()
+        self.failures = min(self.failures + 1, 16)
+        self.nextAttempt = time.monotonic() + delay
+
+    def succeeded(self):
+        """
+        Record a successful connection
+        """
+        self.failures = 0
+        self.nextAttempt = 0.0
+
+    def beacon_seen(self):
+        """
+        The Pixelblaze has announced itself on the network, so if we're waiting to
+        retry, don't wait any longer.
+        """
+        self.nextAttempt = 0.0
+
+    def retry_delay(self) -> float:
+        """
+        Returns seconds until the next attempt
+        """
+        return max(0.0, self.nextAttempt - time.monotonic())
@@ -1,19 +1,30 @@
 """
 DisplayDevice object - handles websocket connection, holds pixel buffer,
 and communication with a single Pixelblaze.  Each DisplayDevice runs in its
-own thread, so any I/O waits or errors will not interfere with other operations.
+own thread (or its own task in the AsyncOutputEngine), so any I/O waits or errors
+will not interfere with other operations.
 We expect that Pixelblaze connections may be intermittent and unreliable, so we
 need to handle errors and reconnections gracefully.
 """
 
 import logging
+import random
 import threading
 from threading import Thread
 
-# import numpy as np
+import numpy as np
 import select
+import socket
+import websocket
 
 from ArtnetUtils import *
+from ConnectionManager import ConnectionManager
+from FrameInbox import FrameInbox
+from FrameOutbox import FrameOutbox
+from FrameScheduler import FrameScheduler
+from FrameSerializer import PixelFrameSerializer, serialize_channels
+from LatencyMonitor import LatencyMonitor
+from RateController import RateController
 from pixelblaze import *
 
 
@@ -30,15 +41,103 @@ class DisplayDevice:
     pixelsReceived = 0
     pixelsUpdated = 0
     maxFps = 1000
+    targetFps = 1000
+    rateController = None
+    scheduler = None
+    outbox = None
+    inbox = None
+    framesSkipped = 0
+    sendBufferSize = 0
+    connectStarted = 0
     ms_per_frame = 0
     packets_in = 0
     packets_out = 0
-    run_flag = threading.Event()
+    bytes_out = 0
+    run_flag = None
     sendFlag = False
     sendFrame = None
+    lastSync = 0
+
+    # Send-on-frame-complete: each universe fragment mapped to this device gets a bit.  When
+    # all of them have arrived since the last complete frame, we send right away instead of
+    # waiting for the frame timer.
+    sendOnComplete = False
+    fragmentMask = 0
+    fragmentsSeen = 0
+    # routing being built by the config parser -- see begin_routing()
+    nextFragmentMask = 0
+    nextGroup = None
+    nextOutputs = ()
+    frameComplete = False
+    lastComplete = 0
+    wakeSender = None
+    wakeReader = None
+    wakeWriter = None
+
+    # Identical-frame suppression: we keep the last payload for each universe fragment, and
+    # data that hasn't changed doesn't mark the device as needing a new frame.  To keep the
+    # Pixelblaze's picture fresh, we resend the current frame every keepaliveInterval seconds.
+    suppressUnchanged = True
+    lastPayload = None
+    unchangedData = False
+    framesSuppressed = 0
+    keepaliveInterval = 1.0
+    lastFrameSent = 0
+
+    # Mirror groups: devices showing identical data share the group leader's buffers and
+    # its encoded frames.  outputs lists the devices that send this device's data.
+    group = None
+    mirrorVersion = None
+    outputs = ()
+
+    # Output workers: the device's buffer lives in shared memory, written by the router
+    # process and sent by a worker process.  sharedSeen is the worker's record of what it's
+    # already picked up.
+    sharedFrame = None
+    sharedSeen = None
+
+    # Idle governor: if no data arrives for idleTimeout seconds, the device stops waking up
+    # for frames and waits for process_packet to wake it.
+    idleTimeout = 10.0
+    idle = False
+    lastPacket = 0
+
+    # Pixel transport modes: "full" sends every pixel in every frame, "delta" sends only
+    # the pixels that differ from the last keyframe, plus a full keyframe at intervals.
+    # Every delta holds all the changes since the keyframe, so the Pixelblaze only
+    # needs the newest one.  deltaReference is the last keyframe, and deltaFrame is
+    # the last frame sent.
+    transport = "full"
+    keyframeInterval = 1.0
+    keyframeDue = True
+    lastKeyframe = 0
+    changeId = 0
+    keyframeId = 0
+    deltaEmpty = True
+
+    # Pixel encodings for the "full" transport:
+    #   rgb24    - 24-bit RGB, one pixel per 16.16 fixed point value.  Use the "Artnet Receiver" pattern.
+    #   rgb565   - 16-bit RGB (5/6/5 bits), one pixel per integer value.  Use "Artnet Receiver 565".
+    #   rgb444x2 - 12-bit RGB (4 bits per channel), two pixels per value.  Use "Artnet Receiver 444x2".
+    ENCODINGS = ("rgb24", "rgb565", "rgb444x2")
+    encoding = "rgb24"
+
+    # Unchanged gaps this short are cheaper to send than to start a new run for.
+    DELTA_MAX_GAP = 2
+
+    # If we haven't seen an ArtSync packet in this many seconds, go back to sending
+    # whatever we've got at each frame (the Art-Net spec says 4 seconds.)
+    SYNC_TIMEOUT = 4.0
+
+    # If no frame has been completed in this many seconds, go back to sending on the frame timer
+    FRAME_COMPLETE_TIMEOUT = 1.0
 
     pixels = []
 
+    # multiplying a row of (r, g, b) bytes by these weights produces ((r << 16) | (g << 8) | b) / 256
+    # in a single step.  They're all powers of two, so the result is exact.
+    PACK_WEIGHTS = np.array([256.0, 1.0, 1.0 / 256.0])
+
     class DeviceStyles(IntEnum):
         Pixels = 0
         Fixture = 1
@@ -62,54 +161,191 @@ class DisplayDevice:
         # We take the lowest of the two.
         self.maxFps = getParam(device, "maxFps", 1000)
         self.maxFps = min(config["maxFps"], self.maxFps)
-        self.sec_per_frame = 1 / self.maxFps
-        # account for overhead in the frame timer
-        self.sec_per_frame -= 0.05 * self.sec_per_frame
+        self.targetFps = self.maxFps
+        self.set_frame_rate(self.maxFps)
+
+        # optionally, adjust the frame rate to what the link and the Pixelblaze can handle
+        if getParam(device, "adaptiveFps", getParam(config, "adaptiveFps", False)):
+            self.rateController = RateController(self.maxFps, min(self.maxFps, getParam(device, "minFps", 5)))
+
+        # optionally, send as soon as all of this device's universes have arrived
+        self.sendOnComplete = getParam(device, "sendOnFrameComplete", getParam(config, "sendOnFrameComplete", False))
+
+        # don't resend frames that haven't changed, except for an occasional keepalive
+        self.suppressUnchanged = getParam(device, "suppressUnchanged", getParam(config, "suppressUnchanged", True))
+        self.keepaliveInterval = getParam(device, "keepaliveMs", getParam(config, "keepaliveMs", 1000)) / 1000
+        self.lastPayload = dict()
+
+        # go idle when there's no data for a while. Zero means never.
+        self.idleTimeout = getParam(device, "idleTimeoutSec", getParam(config, "idleTimeoutSec", 10))
+        self.lastPacket = time.monotonic()
+
+        # until we join a mirror group, we're the only one sending our data
+        self.outputs = (self,)
+
+        # each device has its own, so stopping one doesn't stop the rest
+        self.run_flag = threading.Event()
+
+        # schedules connection attempts, with backoff
+        self.connection = ConnectionManager()
+
+        # keep an eye on how stale frames are getting in the send queue, and optionally,
+        # skip frames when they're over budget. A smaller send buffer limits how bad it can get.
+        self.sendBufferSize = getParam(device, "sendBufferBytes", getParam(config, "sendBufferBytes", 0))
+        budget = getParam(device, "latencyBudgetMs", getParam(config, "latencyBudgetMs", 0))
+        self.latencyMonitor = LatencyMonitor(budget / 1000)
+
+        # optionally, never block on sends -- keep just the latest frame, and write it as the link allows
+        if getParam(device, "nonBlockingSend", getParam(config, "nonBlockingSend", False)):
+            self.outbox = FrameOutbox()
 
         self.sendMethod = self._send_pre_init
 
         # initialize output pixel buffer
-        self.pixels = [0] * self.pixelCount
+        self.pixels = np.zeros(self.pixelCount, dtype=np.float64)
+        self.serializer = PixelFrameSerializer(self.pixelCount)
+
+        # delta transport needs the Pixelblaze's current state to diff against
+        self.transport = getParam(device, "transport", "full")
+        self.encoding = getParam(device, "encoding", "rgb24")
+        if self.encoding not in self.ENCODINGS:
+            logging.warning("%s: unknown encoding '%s', using rgb24" % (self.name, self.encoding))
+            self.encoding = "rgb24"
+        elif self.encoding != "rgb24" and self.transport == "delta":
+            logging.warning("%s: delta transport only supports rgb24 encoding" % self.name)
+            self.encoding = "rgb24"
+        self.encodePixels = {"rgb24": self.encode_rgb24,
+                             "rgb565": self.encode_rgb565,
+                             "rgb444x2": self.encode_rgb444x2}[self.encoding]
+        self.keyframeInterval = getParam(device, "keyframeMs", 1000) / 1000
+        if self.transport == "delta":
+            if self.deviceStyle == self.DeviceStyles.Fixture:
+                self.deltaReference = bytearray(self.pixelCount)
+                self.deltaFrame = bytearray(self.pixelCount)
+            else:
+                self.deltaReference = np.zeros(self.pixelCount, dtype=np.float64)
+                self.deltaFrame = np.zeros(self.pixelCount, dtype=np.float64)
+            # the Pixelblaze may remember a keyframe id from an earlier run, so don't start at zero
+            self.keyframeId = random.randrange(10000)
+
+        # In thread mode, each device runs its own thread.  Otherwise the router
+        # hands the device to a shared output engine, which runs it for us.
+        self.run_flag.set()
+        if getParam(config, "outputEngine", "threads") == "threads":
+            self.start_thread()
 
-        # start the display device thread
+    def start_thread(self):
         thread = Thread(target=self.run_thread)
         thread.daemon = True
-        self.run_flag.set()
-        self.frame_timer = 0
         thread.start()
 
+    def register_fragment(self) -> int:
+        """
+        Called for each universe fragment mapped to this device, when the configuration is loaded.
+        :return: the bit that identifies the fragment in frame completion tracking
+        """
+        bit = self.nextFragmentMask + 1
+        self.nextFragmentMask |= bit
+        return bit
+
+    def begin_routing(self):
+        """
+        Called by the config parser before it registers the device's universe fragments and
+        mirror group.  The new routing is built off to the side, so a device that a reload
+        keeps goes on running on the old routing, connection and all, 'till commit_routing().
+        """
+        self.nextFragmentMask = 0
+        self.nextGroup = None
+        self.nextOutputs = (self,)
+
+    def commit_routing(self):
+        """
+        Switch to the routing built since begin_routing().  Each piece is switched in with a
+        single assignment, so the receiver and sender never see a half-built one.
+        """
+        if self.nextFragmentMask != self.fragmentMask:
+            self.fragmentMask = self.nextFragmentMask
+            self.fragmentsSeen = 0
+        self.outputs = self.nextOutputs
+        if self.nextGroup is not self.group:
+            self.mirrorVersion = None
+            self.group = self.nextGroup
+
     def process_packet(
-        self, dmxPixels: bytearray, startChannel: int, destPixel: int, count: int
+        self, dmxPixels: bytearray, startChannel: int, destPixel: int, count: int, fragmentBit: int = 0
     ):
         """
         Process a packet of DMX data.  This function is called by the main
         ArtnetServer thread when a packet is received.  It will process the
         packet and update the display device's pixel or channel buffer, depending
         on the device's configuration.
-        :param dmxPixels: byte array of DMX data
+
+        dmxPixels may be a memoryview into the receiver's buffer pool, which will be
+        reused for later packets.  Handlers must copy out the data they need rather
+        than holding a reference to it.
+        :param dmxPixels: byte array or memoryview of DMX data
         :param startChannel: starting channel in the Artnet packet
         :param destPixel: index of first pixel or channel in destination array
         :param count: number of pixels or channels to process
+        :param fragmentBit: identifies the universe fragment, for frame completion
+        and change tracking
         """
-        self.packetHandler(dmxPixels, startChannel, destPixel, count)
+        updated = self.pixelsUpdated
+        if self.suppressUnchanged and fragmentBit:
+            # compare this fragment's data with what it sent last time. If it's the same,
+            # there's nothing to do.  Slicing a memoryview doesn't copy.
+            width = 3 if self.deviceStyle == self.DeviceStyles.Pixels else 1
+            payload = dmxPixels[width * startChannel:width * (startChannel + count)]
+            if payload == self.lastPayload.get(fragmentBit):
+                self.packets_in += 1
+                self.unchangedData = True
+            else:
+                self.lastPayload[fragmentBit] = bytes(payload)
+                self.packetHandler(dmxPixels, startChannel, destPixel, count)
+        else:
+            self.packetHandler(dmxPixels, startChannel, destPixel, count)
+        t = time.monotonic()
+
+        complete = False
+        if self.sendOnComplete:
+            self.fragmentsSeen |= fragmentBit
+            if self.fragmentsSeen == self.fragmentMask:
+                self.fragmentsSeen = 0
+                complete = True
+
+        # if data's back, or a frame is complete, wake up the sender(s)
+        for dev in self.outputs:
+            dev.lastPacket = t
+            if complete:
+                dev.frameComplete = True
+                dev.lastComplete = t
+            if dev.idle or complete:
+                dev.idle = False
+                if dev.wakeSender is not None:
+                    dev.wakeSender()
+
+        # with output workers, the sender is in another process
+        if self.sharedFrame is not None:
+            self.sharedFrame.publish(self.pixelsUpdated != updated, t, complete)
 
     def process_channel_data(
         self, dmxPixels: bytearray, startChannel: int, destChannel: int, count: int
     ):
         self.packets_in += 1
         self.pixelsReceived += count
-        self.pixelsUpdated += count
 
-        index = startChannel
-        chNum: int = destChannel
-        maxIndex = min(self.pixelCount, destChannel + count)
+        # figure out how many channels we can actually copy -- limited by both the size of
+        # the channel buffer and the amount of data in the packet
+        count = min(count, self.pixelCount - destChannel, len(dmxPixels) - startChannel)
+        if count <= 0:
+            return
 
-        while chNum < maxIndex:
-            # if data has changed, update the channel data
-            if dmxPixels[index] != self.channelData[chNum]:
-                self.channelData[chNum] = dmxPixels[index]
-            chNum += 1
-            index += 1
+        # compare the whole fragment at once, and only mark the device dirty if
+        # a channel actually moved.
+        data = dmxPixels[startChannel:startChannel + count]
+        if self.channelData[destChannel:destChannel + count] != data:
+            self.channelData[destChannel:destChannel + count] = data
+            self.pixelsUpdated += count
 
     def process_pixel_data(
         self, dmxPixels: bytearray, startChannel: int, destPixel: int, count: int
@@ -130,28 +366,254 @@ class DisplayDevice:
         self.pixelsReceived += count
         self.pixelsUpdated += count
 
-        # copy the pixel data into the display device's pixel buffer
-        index = 3 * startChannel
-        pixNum: int = destPixel
+        # figure out how many pixels we can actually copy -- limited by both the size of
+        # the output buffer and the amount of data in the packet
+        count = min(count, self.pixelCount - destPixel, len(dmxPixels) // 3 - startChannel)
+        if count <= 0:
+            return
 
         # Pack the RGB color data into a single 32-bit fixed point float for compact transmission to a Pixelblaze.
         # This is done by shifting red, green and blue values into a 32-bit integer and dividing
-        # the result by 256 to produce a float.
-        maxIndex = min(self.pixelCount, destPixel + count)
-        while pixNum < maxIndex:
-            self.pixels[pixNum] = (
-                (dmxPixels[index] << 16)
-                | (dmxPixels[index + 1] << 8)
-                | dmxPixels[index + 2]
-            ) / 256.0
-
-            # The Pixelblaze uses a 16.16 fixed point, two's complement representation for pixel data.
-            # If the value is greater than 32767, we need to subtract 65536 to convert it to a negative number
-            # to keep it in a range the Pixelblaze can understand.
-            if self.pixels[pixNum] > 32767:
-                self.pixels[pixNum] = self.pixels[pixNum] - 65536
-            pixNum += 1
-            index += 3
+        # the result by 256 to produce a float.  We do the whole fragment at once, working on a
+        # view of the packet data rather than a copy.
+        rgb = np.frombuffer(dmxPixels, dtype=np.uint8, count=3 * count, offset=3 * startChannel)
+        dest = self.pixels[destPixel:destPixel + count]
+        np.matmul(rgb.reshape(count, 3), self.PACK_WEIGHTS, out=dest)
+
+        # The Pixelblaze uses a 16.16 fixed point, two's complement representation for pixel data.
+        # If the value is greater than 32767, we need to subtract 65536 to convert it to a negative number
+        # to keep it in a range the Pixelblaze can understand.
+        dest[dest > 32767] -= 65536
+
+    def sync(self):
+        """
+        Called by the ArtnetServer thread when an ArtSync packet arrives.  Incoming
+        universes accumulate in the pixel (or channel) buffer; here we latch a copy of it as
+        the next complete frame to send.  The copy is handed to the sender by reference,
+        so the sender never sees a frame that's only partly updated.
+        """
+        self.lastSync = time.monotonic()
+        if self.sharedFrame is not None:
+            # the worker process picks the latched frame up from shared memory
+            self.sharedFrame.sync(self.lastSync, self.pixelsUpdated > 0, self.sendOnComplete)
+            self.pixelsUpdated = 0
+            return
+
+        if self.pixelsUpdated > 0:
+            if self.deviceStyle == self.DeviceStyles.Fixture:
+                self.sendFrame = bytes(self.channelData)
+            else:
+                self.sendFrame = self.pixels.copy()
+            self.pixelsUpdated = 0
+            self.sendFlag = True
+
+            # a latched frame is complete, so if we're waiting for one, send it now
+            if self.sendOnComplete:
+                self.wake()
+
+    def is_synced(self) -> bool:
+        """
+        Returns True if we're getting ArtSync packets, and should only send latched frames
+        """
+        return time.monotonic() - self.lastSync < self.SYNC_TIMEOUT
+
+    def _get_frame(self, liveBuffer):
+        """
+        Returns the next frame to send, or None if there's nothing new.  When ArtSync is
+        active, that's the most recently latched frame.  Otherwise, it's the live buffer,
+        as long as something has changed since the last send.
+        :param liveBuffer: the device's pixel or channel buffer
+        """
+        synced = self.is_synced()
+        if not self.frame_pending(synced):
+            return None
+
+        # if the link's backed up, leave the frame where it is 'till the queue drains
+        if self._link_congested():
+            self.framesSkipped += 1
+            return None
+
+        return self.take_frame(liveBuffer, synced)
+
+    def frame_pending(self, synced: bool) -> bool:
+        """
+        Returns True if there's a new frame to send
+        :param synced: whether ArtSync is active, from is_synced()
+        """
+        if self.sharedFrame is not None:
+            self.sharedFrame.collect(self, self.sharedSeen)
+        if self.sendFlag if synced else self.pixelsUpdated > 0:
+            return True
+        if self.unchangedData:
+            self.unchangedData = False
+            self.framesSuppressed += 1
+        return False
+
+    def take_frame(self, liveBuffer, synced: bool):
+        """
+        Returns the new frame, and marks it as taken.  Call only if frame_pending() says there is one.
+        :param liveBuffer: the device's pixel or channel buffer
+        :param synced: whether ArtSync is active, from is_synced()
+        """
+        if synced:
+            self.sendFlag = False
+            return self.sendFrame
+
+        self.pixelsUpdated = 0
+        return liveBuffer
+
+    def encode_frame(self, frame) -> str:
+        """
+        Returns the message that sends a whole frame to the Pixelblaze
+        """
+        if self.deviceStyle == self.DeviceStyles.Fixture:
+            return '{"setVars":{"channels":[' + serialize_channels(frame) + "]}}"
+        return '{"setVars":{"pixels":[' + self.encodePixels(frame) + "]}}"
+
+    def publish_frame(self, sharedFrame):
+        """
+        Router side of output worker mode: write incoming data to a shared frame for
+        a worker process to send, instead of sending it from here.
+        """
+        self.sharedFrame = sharedFrame
+        self._use_buffer(sharedFrame.live)
+        self.outputs = ()
+
+    def subscribe_frame(self, sharedFrame):
+        """
+        Worker side of output worker mode: send data from a shared frame that the router writes.
+        Mirror group members share it too.
+        """
+        self._use_buffer(sharedFrame.live)
+        for dev in self._buffer_sharers():
+            dev.sharedFrame = sharedFrame
+            dev.sharedSeen = sharedFrame.snapshot()
+
+    def detach_frame(self):
+        """
+        Stop using a shared frame, keeping a private copy of its data, so the
+        shared memory can be freed.
+        """
+        if self.sharedFrame is None:
+            return
+        if self.deviceStyle == self.DeviceStyles.Fixture:
+            self._use_buffer(bytearray(self.sharedFrame.live))
+        else:
+            self._use_buffer(np.array(self.sharedFrame.live))
+        for dev in self._buffer_sharers():
+            dev.sharedFrame = None
+
+    def _buffer_sharers(self) -> tuple:
+        """
+        Returns the devices that use this device's buffer: itself, and any mirror group members if it's the leader
+        """
+        if self.group is not None and self.group.leader is self:
+            return tuple(self.group.members)
+        return (self,)
+
+    def _use_buffer(self, buffer):
+        """
+        Switch to a different pixel or channel buffer, along with any mirror group members
+        """
+        for dev in self._buffer_sharers():
+            if self.deviceStyle == self.DeviceStyles.Fixture:
+                dev.channelData = buffer
+            else:
+                dev.pixels = buffer
+
+    def wake(self):
+        """
+        Wake up the sender(s) for this device's data, if they're idle or waiting for a frame
+        """
+        for dev in self.outputs:
+            dev.idle = False
+            if dev.wakeSender is not None:
+                dev.wakeSender()
+
+    def join_group(self, group):
+        """
+        Called by MirrorGroup.  Once the routing's committed, we show the group leader's data,
+        and send the group's frames.
+        """
+        self.nextGroup = group
+        self.pixels = group.leader.pixels
+        self.channelData = group.leader.channelData
+
+    def frame_complete_active(self) -> bool:
+        """
+        Returns True if we're sending on frame completion, and frames are actually completing
+        """
+        return self.sendOnComplete and time.monotonic() - self.lastComplete < self.FRAME_COMPLETE_TIMEOUT
+
+    def check_idle(self) -> bool:
+        """
+        Returns True if the device is idle.  Goes idle if no data has arrived in idleTimeout
+        seconds, and everything we've received has gone out.
+        """
+        if self.sharedFrame is not None:
+            self.sharedFrame.collect(self, self.sharedSeen)
+
+        if self.idle or self.idleTimeout <= 0:
+            return self.idle
+        if time.monotonic() - self.lastPacket < self.idleTimeout:
+            return False
+        if self.pixelsUpdated > 0 or self.sendFlag or (self.outbox is not None and self.outbox.has_output()):
+            return False
+
+        self.idle = True
+        if self.sharedFrame is not None:
+            self.sharedFrame.set_idle(True)
+            self.sharedFrame.collect(self, self.sharedSeen)
+
+        # a packet may have slipped in while we were deciding
+        if time.monotonic() - self.lastPacket < self.idleTimeout:
+            self.idle = False
+        else:
+            logging.debug("%s: no data for %d seconds, going idle" % (self.name, self.idleTimeout))
+        return self.idle
+
+    def time_until_send(self) -> float:
+        """
+        Returns the number of seconds until we should try to send the next frame.  Normally, that's
+        the next frame deadline.  When sending on frame completion, we also wait for the rest of the
+        frame to arrive -- but never longer than maxFps allows, and not forever.
+        """
+        t = self.scheduler.time_until_frame()
+        # (a frame latched by ArtSync is complete by definition)
+        if self.frame_complete_active() and not (self.frameComplete or self.sendFlag):
+            t = max(t, self.lastComplete + self.FRAME_COMPLETE_TIMEOUT - time.monotonic())
+        return t
+
+    def send_next_frame(self):
+        """
+        Called by the output loop when time_until_send() says it's time to send
+        """
+        realign = self.frame_complete_active()
+        self.frameComplete = False
+        self.scheduler.tick(realign)
+        self.sendMethod()
+        self.flush_output()
+
+    def _get_keepalive_frame(self, liveBuffer):
+        """
+        Returns the current frame if it's time to resend it as a keepalive, otherwise None.
+        Keepalives only go out after we've sent at least one real frame.
+        :param liveBuffer: the device's pixel or channel buffer
+        """
+        if self.keepaliveInterval <= 0 or self.lastFrameSent == 0:
+            return None
+        if time.monotonic() - self.lastFrameSent < self.keepaliveInterval or self._link_congested():
+            return None
+        if self.is_synced() and self.sendFrame is not None:
+            return self.sendFrame
+        return liveBuffer
+
+    def _link_congested(self) -> bool:
+        """
+        Sample the socket's send queue and return True if the estimated latency is over budget
+        """
+        self.latencyMonitor.sample(self.pb.getSendQueueBytes())
+        return self.latencyMonitor.over_budget()
 
     def _send_pre_init(self):
         """
@@ -162,44 +624,325 @@ class DisplayDevice:
         """
 
         if self.pb is not None and self.pb.is_connected():
-            if self.deviceStyle == self.DeviceStyles.Fixture:
-                self.sendMethod = self._send_channel_data
+            if self.group is not None:
+                self.sendMethod = self._send_mirrored
+            elif self.deviceStyle == self.DeviceStyles.Fixture:
+                if self.transport == "delta":
+                    self.sendMethod = self._send_channel_delta
+                else:
+                    self.sendMethod = self._send_channel_data
+            elif self.transport == "delta":
+                self.sendMethod = self._send_pixel_delta
             else:
                 self.sendMethod = self._send_pixel_data
 
+    def set_frame_rate(self, fps: float):
+        """
+        Set the outgoing frame rate
+        """
+        self.targetFps = fps
+        self.sec_per_frame = 1 / fps
+        if self.scheduler is None:
+            self.scheduler = FrameScheduler(self.sec_per_frame)
+        else:
+            self.scheduler.set_interval(self.sec_per_frame)
+
+    def _send_frame(self, message: str):
+        """
+        Send a message to the Pixelblaze, and count it.  In non-blocking mode,
+        the message goes in the outbox, replacing any frame that hasn't gone out yet.
+        """
+        self.lastFrameSent = time.monotonic()
+        if self.outbox is not None:
+            self.outbox.submit(message)
+            self.flush_output()
+            return
+
+        if self.rateController is None:
+            self.pb.ws.send(message)
+        else:
+            t = time.perf_counter()
+            self.pb.ws.send(message)
+            self._observe_send(time.perf_counter() - t, len(message))
+
+        self.packets_out += 1
+        self.bytes_out += len(message)
+        self.latencyMonitor.recordSent(len(message))
+
+    def flush_output(self):
+        """
+        Non-blocking mode: write as much of the outbox as the socket will take right now.
+        The output engines call this every frame, so a partly sent frame keeps moving
+        even when there's no new data.
+        """
+        if self.outbox is None or not self.outbox.has_output():
+            return
+
+        # a frame that isn't going anywhere means the link's dead, same as a blocking send timing out
+        if self.outbox.stalled(self.pb.default_recv_timeout):
+            raise TimeoutError("Send stalled")
+
+        t = time.perf_counter()
+        sentBefore = self.outbox.bytesSent
+        writtenBefore = self.outbox.bytesWritten
+        self.packets_out += self.outbox.flush(self.pb.ws.sock)
+        sent = self.outbox.bytesSent - sentBefore
+        self.bytes_out += sent
+        self.latencyMonitor.recordSent(self.outbox.bytesWritten - writtenBefore)
+
+        if self.rateController is not None and sent > 0:
+            self._observe_send(time.perf_counter() - t, sent)
+
+    def use_nonblocking_io(self):
+        """
+        Never wait on the Pixelblaze's socket:  send through the outbox, and receive through
+        an inbox, which only hands over messages that have completely arrived.
+        """
+        if self.outbox is None:
+            self.outbox = FrameOutbox()
+        if self.inbox is None:
+            self.inbox = FrameInbox()
+
+    def receive_available(self):
+        """
+        Non-blocking receive: handle every complete message that's arrived from the Pixelblaze.
+        Only call when the socket's readable.
+        """
+        for opcode, payload in self.inbox.read(self.pb.ws.sock):
+            if opcode == websocket.ABNF.OPCODE_TEXT:
+                self.pb.saveTextMessage(payload.decode(errors="replace"))
+            elif opcode == websocket.ABNF.OPCODE_PING:
+                self.outbox.submit_pong(payload)
+
+    def _observe_send(self, duration: float, size: int):
+        """
+        Tell the rate controller about a send, and pick up any change in frame rate
+        """
+        rc = self.rateController
+        rc.observeSend(duration, size, self.pb.getSendQueueBytes())
+        rc.observeStats(self.pb.latestStats)
+        fps = rc.update()
+        if fps != self.targetFps:
+            self.set_frame_rate(fps)
+
+    def encode_rgb24(self, frame) -> str:
+        """
+        Format packed 16.16 pixel values for sending
+        """
+        return self.serializer.serialize(frame)
+
+    @staticmethod
+    def unpack_rgb(frame):
+        """
+        Recover 8-bit red, green and blue arrays from packed 16.16 pixel values
+        """
+        rgb = np.rint(frame * 256).astype(np.int64) & 0xFFFFFF
+        return rgb >> 16, (rgb >> 8) & 0xFF, rgb & 0xFF
+
+    def encode_rgb565(self, frame) -> str:
+        """
+        Format pixels as 16-bit 5/6/5 RGB integers.  The Pixelblaze's integers are
+        signed 16 bits, so the top half of the range wraps around to negative numbers.
+        """
+        r, g, b = self.unpack_rgb(frame)
+        values = ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)
+        values[values > 32767] -= 65536
+        return ",".join(map(str, values.tolist()))
+
+    def encode_rgb444x2(self, frame) -> str:
+        """
+        Format pixels as 12-bit 4/4/4 RGB, two pixels per value: the even pixel in the
+        integer part and the odd pixel in the top 12 bits of the fraction.  The bottom four
+        bits of the fraction are set halfway, so the value survives being rounded to four
+        decimal places.
+        """
+        r, g, b = self.unpack_rgb(frame)
+        values = ((r >> 4) << 8) | ((g >> 4) << 4) | (b >> 4)
+        if len(values) % 2:
+            values = np.append(values, 0)
+        values = values[0::2] + (values[1::2] * 16 + 8) / 65536
+        return ",".join(f"{x:.4f}".rstrip("0").rstrip(".") for x in values.tolist())
+
     def _send_pixel_data(self):
         """
         Send a frame of packed pixel data to the Pixelblaze
         """
+        frame = self._get_frame(self.pixels)
+        if frame is None:
+            frame = self._get_keepalive_frame(self.pixels)
+        if frame is not None:
+            self._send_frame(self.encode_frame(frame))
 
-        if self.pixelsUpdated > 0:
-            # go to great lengths to get rid of the spaces, zeros and spurious digits python
-            # *really* wants you to have.  We want to send out as few bytes of data as possible.
-            self.pb.ws.send(
-                '{"setVars":{"pixels":['
-                + ",".join(f"{x:5g}".lstrip(" ") for x in self.pixels)
-                + "]}}"
-            )
-            self.packets_out += 1
-            self.pixelsUpdated = 0
+    def _send_pixel_delta(self):
+        """
+        Send only the pixels that differ from the last keyframe, as runs of
+        [startIndex, count, value, value, ...] for the "Artnet Delta Receiver" pattern
+        to apply. Sends a full keyframe instead at keyframe intervals, after a reconnect,
+        or whenever the changes would take more space than the whole frame.
+        """
+        t = time.monotonic()
+        frame = self._get_frame(self.pixels)
+        if frame is None:
+            # nothing new, but keep sending keyframes so a static look still gets repaired
+            if t - self.lastKeyframe < self.keyframeInterval or self._link_congested():
+                return
+            frame = self.deltaFrame
+
+        if not self.keyframeDue and t - self.lastKeyframe < self.keyframeInterval:
+            # diff against the keyframe, not the last delta, so if the Pixelblaze only gets
+            # to render some of our deltas, the newest one still has everything it needs.
+            changed = np.flatnonzero(frame != self.deltaReference)
+
+            # if we're back to the keyframe, the Pixelblaze still needs an empty list to undo the last one
+            if len(changed) == 0 and self.deltaEmpty:
+                return
+
+            # split the changed pixels into runs wherever there's a big enough gap
+            if len(changed) == 0:
+                starts, ends = [], []
+            else:
+                breaks = np.flatnonzero(np.diff(changed) > self.DELTA_MAX_GAP + 1)
+                starts = changed[np.concatenate(([0], breaks + 1))].tolist()
+                ends = (changed[np.concatenate((breaks, [len(changed) - 1]))] + 1).tolist()
+
+            # the Pixelblaze's change list holds pixelCount values.  If we'd need more
+            # than that, a keyframe is smaller anyway.
+            size = 2 * len(starts) + sum(ends) - sum(starts)
+            if size <= self.pixelCount:
+                self.serializer.update(frame)
+                runs = []
+                for start, end in zip(starts, ends):
+                    runs.append(f"{start},{end - start},")
+                    runs.append(self.serializer.serialize_range(start, end))
+                    runs.append(",")
+
+                self.changeId = (self.changeId + 1) % 10000
+                self._send_frame(
+                    '{"setVars":{"changes":['
+                    + "".join(runs)[:-1]
+                    + f'],"changeCount":{size},"changeId":{self.changeId}}}}}'
+                )
+                np.copyto(self.deltaFrame, frame)
+                self.deltaEmpty = size == 0
+                return
+
+        # send a keyframe
+        self.keyframeId = (self.keyframeId + 1) % 10000
+        self._send_frame('{"setVars":{"pixels":[' + self.encode_rgb24(frame)
+                         + f'],"changeCount":0,"keyframeId":{self.keyframeId}}}}}')
+        np.copyto(self.deltaReference, frame)
+        np.copyto(self.deltaFrame, frame)
+        self.deltaEmpty = True
+        self.keyframeDue = False
+        self.lastKeyframe = t
 
     def _send_channel_data(self):
         """
         Send a frame of DMX channel data to the Pixelblaze as bytes
         """
+        frame = self._get_frame(self.channelData)
+        if frame is None:
+            frame = self._get_keepalive_frame(self.channelData)
+        if frame is not None:
+            self._send_frame(self.encode_frame(frame))
 
-        if self.pixelsUpdated > 0:
-            # go to great lengths to get rid of the spaces, zeros and spurious digits python
-            # *really* wants you to have.  We want to send out as few bytes of data as possible.
-            # self.pb.ws.send(
-            self.pb.ws.send(
-                '{"setVars":{"channels":['
-                + ",".join(f"{x:d}".lstrip(" ") for x in self.channelData)
-                + "]}}"
-            )
-
-            self.packets_out += 1
-            self.pixelsUpdated = 0
+    def _send_mirrored(self):
+        """
+        Send the mirror group's latest frame, which the group encodes just once for all its members
+        """
+        version, message = self.group.latest_frame()
+        if message is None:
+            return
+
+        if version == self.mirrorVersion:
+            # nothing new, but send a keepalive now and then
+            if (self.keepaliveInterval <= 0 or
+                    time.monotonic() - self.lastFrameSent < self.keepaliveInterval):
+                return
+
+        # if the link's backed up, skip this one
+        if self._link_congested():
+            self.framesSkipped += 1
+            return
+
+        self._send_frame(message)
+        self.mirrorVersion = version
+
+    def _send_channel_delta(self):
+        """
+        Send only the DMX channels that differ from the last keyframe, as pairs of
+        [channel, value, channel, value, ...] for the "Artnet RGB Fixture" pattern to apply.
+        Sends all the channels instead at keyframe intervals, after a reconnect, or
+        whenever the changes would take more space than the whole frame.
+        """
+        t = time.monotonic()
+        frame = self._get_frame(self.channelData)
+        if frame is None:
+            # nothing new, but keep sending keyframes so a static look still gets repaired
+            if t - self.lastKeyframe < self.keyframeInterval or self._link_congested():
+                return
+            frame = self.deltaFrame
+
+        if not self.keyframeDue and t - self.lastKeyframe < self.keyframeInterval:
+            # like pixel deltas, each list has every change since the keyframe
+            values = np.frombuffer(frame, dtype=np.uint8)
+            changed = np.flatnonzero(values != np.frombuffer(self.deltaReference, dtype=np.uint8))
+            if len(changed) == 0 and self.deltaEmpty:
+                return
+
+            if 2 * len(changed) < self.pixelCount:
+                pairs = np.column_stack((changed, values[changed])).ravel().tolist()
+                self.changeId = (self.changeId + 1) % 10000
+                self._send_frame(
+                    '{"setVars":{"channelChanges":['
+                    + ",".join(map(str, pairs))
+                    + f'],"channelChangeCount":{len(changed)},"channelChangeId":{self.changeId}}}}}'
+                )
+                self.deltaFrame[:] = frame
+                self.deltaEmpty = len(changed) == 0
+                return
+
+        # send a keyframe
+        self.keyframeId = (self.keyframeId + 1) % 10000
+        self._send_frame('{"setVars":{"channels":[' + serialize_channels(frame)
+                         + f'],"channelChangeCount":0,"channelKeyframeId":{self.keyframeId}}}}}')
+        self.deltaReference[:] = frame
+        self.deltaFrame[:] = frame
+        self.deltaEmpty = True
+        self.keyframeDue = False
+        self.lastKeyframe = t
+
+    def getStatus(self, et) -> dict:
+        """
+        Return a dictionary of status information for the display device
+        :param et: elapsed time in seconds
+        :return: status dictionary
+        """
+        inP = round(self.packets_in / et, 1)
+        outF = round(self.packets_out / et, 1)
+        bpf = round(self.bytes_out / self.packets_out) if self.packets_out > 0 else 0
+        p50, p99 = self.scheduler.getJitterStatistics()
+        return {
+            "name": self.name,
+            "inPps": inP,
+            "outFps": outF,
+            "ip": self.ip,
+            "maxFps": self.maxFps,
+            "targetFps": round(self.targetFps, 1),
+            "connected": self.pb is not None and self.pb.is_connected(),
+            "synced": self.is_synced(),
+            "encoding": self.encoding,
+            "bytesPerFrame": bpf,
+            "droppedFrames": 0 if self.outbox is None else self.outbox.framesDropped,
+            "skippedFrames": self.framesSkipped,
+            "latencyMs": round(self.latencyMonitor.latency * 1000),
+            "frameMsP50": round(p50 * 1000, 1),
+            "frameMsP99": round(p99 * 1000, 1),
+            "missedFrames": self.scheduler.missed,
+            "suppressedFrames": self.framesSuppressed,
+            "state": "idle" if self.idle else "active",
+            "group": "" if self.group is None else self.group.name,
+        }
 
     def getStatusString(self, et):
         """
@@ -207,22 +950,7 @@ class DisplayDevice:
         :param et: elapsed time in seconds
         :return: status string
         """
-        if self.pb is None:
-            is_connected = "false"
-        else:
-            is_connected = "true" if self.pb.is_connected() else "false"
-        inP = round(self.packets_in / et, 1)
-        outF = round(self.packets_out / et, 1)
-        return json.dumps(
-            {
-                "name": self.name,
-                "inPps": inP,
-                "outFps": outF,
-                "ip": self.ip,
-                "maxFps": self.maxFps,
-                "connected": is_connected,
-            }
-        )
+        return json.dumps(self.getStatus(et))
 
     def resetCounters(self):
         """
@@ -230,64 +958,189 @@ class DisplayDevice:
         """
         self.packets_in = 0
         self.packets_out = 0
+        self.bytes_out = 0
         self.pixelsReceived = 0
+        self.framesSkipped = 0
+        self.framesSuppressed = 0
+        self.scheduler.resetStatistics()
+        if self.outbox is not None:
+            self.outbox.framesDropped = 0
 
-    def run_thread(self):
+    def open_pixelblaze(self):
         """
-        Create Pixelblaze device object, and attempt to open it and
-        maintain a websocket connection. Note that this can fail,
-        which means that the object will try to establish the connection on the next
-        (and subsequent) attempts to use it.
+        Create Pixelblaze device object, and make the first attempt to open it.
+        Note that this can fail, which means that we'll try to establish
+        the connection again at intervals.
         """
-        self.pb = Pixelblaze(self.ip)
-        # always turn off preview frames to save Pixelblaze CPU and bandwidth
-        self.pb.setSendPreviewFrames(False)
+        self.pb = Pixelblaze(self.ip, self.sendBufferSize, connect=False)
+        self.reconnect()
 
         logging.debug("Pixelblaze: %s (%s) initializing." % (self.name, self.ip))
         logging.debug(
             "Connection is %s" % ("open" if self.pb.is_connected() else "NOT open")
         )
 
-        frame_timer = time.time()
+    def reconnect(self):
+        """
+        Try to (re)open the connection without blocking.  Starts a non-blocking connect if
+        the connection manager says it's time, or checks on the one that's in progress.
+        """
+        pb = self.pb
+        try:
+            if not pb.is_connecting():
+                if not self.connection.ready():
+                    return
+                self.connectStarted = time.monotonic()
+                pb.beginOpen()
+
+            if not pb.pollOpen():
+                # give up on attempts that are taking too long, and try again later.
+                if time.monotonic() - self.connectStarted > pb.default_connect_timeout:
+                    pb.cancelOpen()
+                    self.connection.failed()
+                return
+
+        except Exception as e:
+            logging.debug("Pixelblaze %s (%s) connection attempt failed: %s" % (self.name, self.ip, str(e)))
+            pb.close()
+            self.connection.failed()
+            return
+
+        self.connection.succeeded()
+        # always turn off preview frames to save Pixelblaze CPU and bandwidth
+        pb.setSendPreviewFrames(False)
+
+    def beacon_seen(self):
+        """
+        Called when we hear a beacon from this device's Pixelblaze.  If we're not
+        connected, try again right away.
+        """
+        if self.pb is None or not self.pb.is_connected():
+            self.connection.beacon_seen()
+            # the async engine waits out the backoff on its loop, so let it know
+            if self.wakeSender is not None:
+                self.wakeSender()
+
+    def connection_lost(self, e: Exception):
+        """
+        minimalist exception handling: if we get an exception it is going to be a
+        connection error of some sort, and we'll need to keep trying to reconnect at intervals.
+        """
+        logging.debug(
+            "Pixelblaze %s (%s) stalled or disconnected." % (self.name, self.ip)
+        )
+        logging.debug("Exception: %s" % str(e))
+        if self.pb is not None:
+            # in non-blocking mode, a close frame could be stuck behind a partly sent frame
+            self.pb.close(graceful=self.outbox is None)
+
+        # we don't know what the Pixelblaze has now, so start over with a keyframe
+        self.keyframeDue = True
+        self.mirrorVersion = None
+        self.latencyMonitor.reset()
+        if self.outbox is not None:
+            self.outbox.reset()
+        if self.inbox is not None:
+            self.inbox.reset()
+
+    def run_thread(self):
+        """
+        Thread mode main loop: open the Pixelblaze and maintain a websocket connection,
+        sending frames as data arrives.
+        """
+        # in non-blocking mode, receive through the inbox too, so a partial message can't
+        # hold us up, and replies to pings go out through the outbox, between frames.
+        if self.outbox is not None:
+            self.use_nonblocking_io()
+
+        self.open_pixelblaze()
+        self.scheduler.reset()
+
+        # the receiver wakes us up when data arrives while we're idle, or
+        # (in send-on-frame-complete mode) when a frame is complete
+        self.wakeReader, self.wakeWriter = socket.socketpair()
+        self.wakeReader.setblocking(False)
+        self.wakeWriter.setblocking(False)
+        self.wakeSender = self._wake_thread
 
         # eat incoming traffic and send data to the Pixelblaze
         while self.run_flag.is_set():
             try:
                 if self.pb.is_connected():
-                    ready = select.select([self.pb.ws.sock], [], [], 0)
-                    if ready[0]:
-                        self.pb.wsReceive()
-
-                    # sleep 'till it's time to send a frame
-                    t = time.time()
-                    time.sleep(min(self.sec_per_frame, t - frame_timer))
-                    frame_timer = t
+                    # handle incoming traffic while we wait for the next frame deadline.  If we're
+                    # idle, there's no deadline -- we wait 'till the receiver wakes us up.
+                    # In non-blocking mode, we also finish partly sent frames as the socket has room.
+                    idle = self.check_idle()
+                    sock = self.pb.ws.sock
+                    writing = [sock] if self.outbox is not None and self.outbox.has_output() else []
+                    ready, writable, _ = select.select([sock, self.wakeReader], writing, [],
+                                                       None if idle else self.time_until_send())
+                    if sock in ready:
+                        if self.inbox is not None:
+                            self.receive_available()
+                        else:
+                            self.pb.wsReceive()
+                    if writable:
+                        self.flush_output()
+                    if self.wakeReader in ready:
+                        self._drain_wakeups()
+                    if idle:
+                        # start a fresh frame schedule if we're waking up
+                        if not self.idle:
+                            self.scheduler.reset()
+                        continue
+                    if self.time_until_send() > 0:
+                        continue
 
                     # send any data we've received
-                    self.sendMethod()
+                    self.send_next_frame()
                 else:
-                    # sleep for a short interval. Even though pb.open will only retry every 2 seconds
-                    # we can spare the CPU (and the GIL) for a bit to let other threads run.
+                    # sleep for a short interval. The connection manager decides when
+                    # it's actually time to try again, so this costs almost nothing.
                     time.sleep(0.25)
-                    self.pb.open()
-                    self.pb.setSendPreviewFrames(False)
+                    self.reconnect()
+                    self.scheduler.reset()
 
-            # minimalist exception handling: if we get an exception it is going to be a
-            # connection error of some sort, and we'll need to keep trying to reconnect at intervals.
-            # TODO - add an exponential backoff timer to the reconnect attempts?
             except Exception as e:
-                logging.debug(
-                    "Pixelblaze %s (%s) stalled or disconnected." % (self.name, self.ip)
-                )
-                logging.debug("Exception: %s" % str(e))
-                self.pb.close()
+                self.connection_lost(e)
+
+        self.wakeSender = None
+        self.wakeReader.close()
+        self.wakeWriter.close()
+
+    def _wake_thread(self):
+        try:
+            self.wakeWriter.send(b"\x00")
+        except (BlockingIOError, OSError):
+            # there's already a wakeup waiting, or we're shutting down
+            pass
+
+    def _drain_wakeups(self):
+        try:
+            while self.wakeReader.recv(256):
                 pass
+        except (BlockingIOError, OSError):
+            pass
+
+    @staticmethod
+    def stop_all(devices):
+        """
+        Stop a collection of devices all at once, so their connections close in parallel
+        """
+        threads = [Thread(target=dev.stop, daemon=True) for dev in devices]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
 
     def stop(self):
         self.run_flag.clear()
         if self.pb is not None:
             self.pb.close()
         self.pb = None
+        if self.wakeSender is not None:
+            self.wakeSender()
+            self.wakeSender = None
 
     def __str__(self):
         return (
@@ -20,7 +20,7 @@
 """
 import argparse
 import logging
-from ProcessManager import startArtnetRouter
+from ProcessManager import startArtnetRouter, stopArtnetRouter
 from ProjectData import ProjectData
 from WebInterface import RemiWrapper
 
@@ -63,7 +63,7 @@ def main():
         message = "Terminated by unexpected exception: " + str(e)
         logging.error(message)
 
-    pd.routerProcess.join()
+    stopArtnetRouter(pd)
     print("Flamecaster shutting down. Thank you for playing!")
 
 if __name__ == '__main__':
@@ -0,0 +1,106 @@
+"""
+FrameInbox.py - Non-blocking websocket input for a single Pixelblaze.
+
+The websocket library's recv() waits until it has a whole message, so if a Pixelblaze
+stops halfway through one, whoever called it is stuck until the socket times out.
+The inbox takes whatever bytes have arrived, keeps any partial frame for next time,
+and hands back only the messages that are complete, so the reader never blocks.
+"""
+import socket
+
+import websocket
+
+# as with FrameOutbox, make the read itself non-blocking where we can
+RECV_FLAGS = getattr(socket, "MSG_DONTWAIT", 0)
+RECV_SIZE = 65536
+
+
+class FrameInbox:
+    opcode = None
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.fragments = []
+
+    def read(self, sock) -> list:
+        """
+        Read what's arrived on the socket.  Only call when the socket is readable.
+        :param sock: the websocket's underlying socket
+        :return: list of (opcode, payload) for each complete message
+        :raises WebSocketConnectionClosedException: if the Pixelblaze closed the connection
+        """
+        try:
+            data = sock.recv(RECV_SIZE, RECV_FLAGS)
+        except (BlockingIOError, InterruptedError):
+            return []
+        if not data:
+            raise websocket.WebSocketConnectionClosedException("Connection closed by Pixelblaze")
+        self.buffer += data
+
+        messages = []
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return messages
+            fin, opcode, payload = frame
+
+            if opcode == websocket.ABNF.OPCODE_CLOSE:
+                raise websocket.WebSocketConnectionClosedException("Connection closed by Pixelblaze")
+
+            # control frames can turn up between the pieces of a fragmented message
+            if opcode >= websocket.ABNF.OPCODE_CLOSE:
+                messages.append((opcode, payload))
+                continue
+
+            if opcode != websocket.ABNF.OPCODE_CONT:
+                self.opcode = opcode
+                self.fragments = []
+            self.fragments.append(payload)
+            if fin and self.opcode is not None:
+                messages.append((self.opcode, b"".join(self.fragments)))
+                self.opcode = None
+                self.fragments = []
+
+    def _next_frame(self):
+        """
+        Take the next complete frame from the buffer
+        :return: (fin, opcode, payload), or None if we don't have a whole frame yet
+        """
+        buf = self.buffer
+        if len(buf) < 2:
+            return None
+        fin = buf[0] & 0x80
+        opcode = buf[0] & 0x0f
+        masked = buf[1] & 0x80
+        length = buf[1] & 0x7f
+
+        pos = 2
+        if length == 126:
+            pos = 4
+        elif length == 127:
+            pos = 10
+        if len(buf) < pos:
+            return None
+        if pos > 2:
+            length = int.from_bytes(buf[2:pos], byteorder="big")
+
+        mask = None
+        if masked:
+            mask = bytes(buf[pos:pos + 4])
+            pos += 4
+        if len(buf) < pos + length:
+            return None
+
+        payload = bytes(buf[pos:pos + length])
+        if mask is not None:
+            payload = websocket.ABNF.mask(mask, payload)
+        del buf[:pos + length]
+        return fin, opcode, payload
+
+    def reset(self):
+        """
+        Throw away everything.  Call when the connection is lost.
+        """
+        self.buffer = bytearray()
+        self.fragments = []
+        self.opcode = None
@@ -0,0 +1,114 @@
+"""
+FrameOutbox.py - Non-blocking, latest-frame-wins websocket output for a single Pixelblaze.
+
+When a Wi-Fi link degrades, a blocking send holds up the sender until the
+socket times out, while frames pile up in the kernel's buffers and arrive seconds
+late.  Instead, the outbox holds at most one frame waiting to be sent.  A newer frame
+replaces a waiting one, and the frame that's actually on its way out is written
+a piece at a time, whenever the socket has room for it, so the sender never blocks.
+"""
+import select
+import socket
+import time
+
+import websocket
+
+# Linux and friends can make a single send non-blocking.  Elsewhere, we send
+# small pieces once the socket says it has room.
+SEND_FLAGS = getattr(socket, "MSG_DONTWAIT", 0)
+CHUNK_SIZE = 65536 if SEND_FLAGS else 1024
+
+
+class FrameOutbox:
+    pending = None
+    inflight = None
+    inflightIsFrame = False
+    offset = 0
+    lastProgress = 0
+
+    def __init__(self):
+        self.control = []
+        self.framesSent = 0
+        self.bytesSent = 0
+        self.bytesWritten = 0
+        self.framesDropped = 0
+
+    def submit(self, message: str):
+        """
+        Queue a text frame to be sent, replacing any frame that hasn't started going out yet.
+        """
+        if self.pending is not None:
+            self.framesDropped += 1
+        self.pending = message
+
+    def submit_pong(self, payload: bytes):
+        """
+        Queue a pong in reply to a ping.  It goes out ahead of any waiting frame,
+        but never in the middle of one that's partly sent.
+        """
+        self.control.append(websocket.ABNF.create_frame(payload, websocket.ABNF.OPCODE_PONG).format())
+
+    def has_output(self) -> bool:
+        """
+        Returns True if there's a frame waiting or partly sent
+        """
+        return self.pending is not None or self.inflight is not None or len(self.control) > 0
+
+    def stalled(self, timeout: float) -> bool:
+        """
+        Returns True if a partly sent frame hasn't moved in timeout seconds
+        """
+        return self.inflight is not None and time.monotonic() - self.lastProgress > timeout
+
+    def flush(self, sock) -> int:
+        """
+        Write as much as the socket will take right now without blocking.
+        :param sock: the websocket's underlying socket
+        :return: number of frames completely written
+        """
+        completed = 0
+        while True:
+            if self.inflight is None:
+                if self.control:
+                    self.inflight = memoryview(self.control.pop(0))
+                    self.inflightIsFrame = False
+                elif self.pending is not None:
+                    frame = websocket.ABNF.create_frame(self.pending, websocket.ABNF.OPCODE_TEXT)
+                    self.inflight = memoryview(frame.format())
+                    self.inflightIsFrame = True
+                    self.pending = None
+                else:
+                    return completed
+                self.offset = 0
+                self.lastProgress = time.monotonic()
+
+            # The websocket's socket has a timeout set, which makes Python wait for it to
+            # become writable before sending, so we have to check first.
+            if not select.select([], [sock], [], 0)[1]:
+                return completed
+
+            try:
+                n = sock.send(self.inflight[self.offset:self.offset + CHUNK_SIZE], SEND_FLAGS)
+            except (BlockingIOError, InterruptedError):
+                return completed
+
+            self.offset += n
+            self.bytesWritten += n
+            if n > 0:
+                self.lastProgress = time.monotonic()
+            if self.offset >= len(self.inflight):
+                if self.inflightIsFrame:
+                    self.framesSent += 1
+                    self.bytesSent += len(self.inflight)
+                    completed += 1
+                self.inflight = None
+
+    def reset(self):
+        """
+        Throw away everything.  Call when the connection is lost -- a partly sent
+        frame can't be finished on a new connection.
+        """
+        self.pending = None
+        self.inflight = None
+        self.offset = 0
+        self.control = []
@@ -0,0 +1,90 @@
+"""
+FrameScheduler.py - Paces a display device's output on fixed frame boundaries.
+
+Frame deadlines are laid out on a regular grid on the monotonic clock, so the output
+rate doesn't drift with however long each frame takes to send.  If we fall
+behind and miss a deadline, we skip ahead to the next one on the grid rather than
+sending a burst of frames to catch up.
+
+The scheduler also keeps the intervals between recent frame ticks, so we can report
+how steady the output actually is.
+"""
+import math
+import time
+from collections import deque
+
+import numpy as np
+
+
+class FrameScheduler:
+    # number of recent inter-frame intervals to keep for statistics
+    HISTORY = 512
+
+    def __init__(self, interval: float):
+        """
+        :param interval: time between frames, in seconds
+        """
+        self.interval = interval
+        self.deadline = time.monotonic()
+        self.lastTick = None
+        self.missed = 0
+        self.intervals = deque(maxlen=self.HISTORY)
+
+    def set_interval(self, interval: float):
+        """
+        Change the frame interval.  Takes effect from the next deadline.
+        """
+        self.interval = interval
+
+    def reset(self):
+        """
+        Start a fresh schedule, with the first frame due now.  Call after a gap in
+        output, like a reconnection, so the gap doesn't count as missed frames.
+        """
+        self.deadline = time.monotonic()
+        self.lastTick = None
+
+    def time_until_frame(self) -> float:
+        """
+        Returns seconds until the next frame is due, or 0 if it's due now
+        """
+        return max(0.0, self.deadline - time.monotonic())
+
+    def tick(self, realign: bool = False) -> float:
+        """
+        Call when the frame that was due has been handled.  Records timing, and moves the
+        deadline to the next frame boundary that hasn't already passed.
+        :param realign: if True, start a new grid with the next frame one interval from
+        now.  Used when output follows the incoming data rather than the clock.
+        :return: the current monotonic time
+        """
+        now = time.monotonic()
+        if self.lastTick is not None:
+            self.intervals.append(now - self.lastTick)
+        self.lastTick = now
+
+        if realign:
+            self.deadline = now + self.interval
+            return now
+
+        self.deadline += self.interval
+        if self.deadline <= now:
+            # we're late. Skip the frames we missed, and stay on the grid.
+            skipped = math.floor((now - self.deadline) / self.interval) + 1
+            self.missed += skipped
+            self.deadline += skipped * self.interval
+        return now
+
+    def getJitterStatistics(self) -> tuple:
+        """
+        Returns the median and 99th percentile of recent inter-frame intervals, in
+        seconds, or (0, 0) if we don't have any yet.
+        """
+        if len(self.intervals) == 0:
+            return 0.0, 0.0
+        p50, p99 = np.percentile(np.fromiter(self.intervals, dtype=np.float64), [50, 99])
+        return float(p50), float(p99)
+
+    def resetStatistics(self):
+        self.missed = 0
+        self.intervals.clear()
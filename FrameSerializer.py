@@ -0,0 +1,72 @@
+"""
+FrameSerializer.py - Builds the text of the pixel and channel arrays we send to
+Pixelblazes.
+
+Formatting numbers is most of the cost of sending a frame, and in most shows
+only some of the pixels change from one frame to the next.  So we keep the
+formatted string for every pixel, and only reformat the ones whose values have
+changed.  Output is exactly the same as formatting every value each time.
+"""
+import numpy as np
+
+# DMX channel values can only be 0-255, so we can format them all in advance
+CHANNEL_STRINGS = tuple(str(n) for n in range(256))
+
+
+def serialize_channels(channels) -> str:
+    """
+    Format a bytes-like object of DMX channel values as a comma separated list
+    """
+    return ",".join(map(CHANNEL_STRINGS.__getitem__, channels))
+
+
+class PixelFrameSerializer:
+    """
+    Formats frames of packed 16.16 pixel values, caching the string for each
+    pixel between frames.
+    """
+
+    def __init__(self, pixelCount: int):
+        self.cache = ["0"] * pixelCount
+        # The bit patterns of the last values we formatted.  Comparing bits, rather than
+        # values, means that (for example) 0.0 and -0.0 are treated as different, since
+        # they format differently.  All ones is a NaN, which we'll never see in a frame,
+        # so every pixel gets formatted the first time through.
+        self.lastBits = np.full(pixelCount, -1, dtype=np.int64)
+
+    @staticmethod
+    def format_value(x: float) -> str:
+        # go to great lengths to get rid of the spaces, zeros and spurious digits python
+        # *really* wants you to have.  We want to send out as few bytes of data as possible.
+        return f"{x:5g}".lstrip(" ")
+
+    def update(self, frame: np.ndarray):
+        """
+        Reformat any pixels that have changed since the last call.
+        :param frame: float64 array of packed pixel values
+        """
+        bits = frame.view(np.int64)
+        changed = np.flatnonzero(bits != self.lastBits)
+        if len(changed) == 0:
+            return
+
+        cache = self.cache
+        fmt = self.format_value
+        values = frame[changed].tolist()
+        for index, value in zip(changed.tolist(), values):
+            cache[index] = fmt(value)
+        np.copyto(self.lastBits, bits)
+
+    def serialize(self, frame: np.ndarray) -> str:
+        """
+        Return a frame of pixel values as a comma separated list
+        """
+        self.update(frame)
+        return ",".join(self.cache)
+
+    def serialize_range(self, start: int, end: int) -> str:
+        """
+        Return the cached strings for a range of pixels as a comma separated list.  Call
+        update() with the current frame first.
+        """
+        return ",".join(self.cache[start:end])
@@ -0,0 +1,85 @@
+"""
+LatencyMonitor.py - Estimates how long data we send to a Pixelblaze spends waiting
+in the TCP send queue before it goes out over the network.
+
+We sample the number of unsent bytes in the socket's queue, and keep track of how many
+bytes we've handed to the socket since the last sample.  The difference is what the
+network drained in that time, which gives us a running estimate of the link's
+throughput.  Queue depth divided by throughput is roughly how stale a frame will be by
+the time it gets to the Pixelblaze.
+"""
+import time
+
+
+class LatencyMonitor:
+    # don't estimate throughput over intervals shorter than this (seconds)
+    MIN_SAMPLE_INTERVAL = 0.05
+    # smoothing factor for the throughput estimate
+    ALPHA = 0.3
+    # upper limit on the latency estimate, for when the link isn't draining at all
+    MAX_LATENCY = 10.0
+
+    def __init__(self, budget: float = 0):
+        """
+        :param budget: latency budget in seconds.  If the estimated latency is over
+        budget, the device should skip frames until the queue drains.  Zero means no budget.
+        """
+        self.budget = budget
+        self.throughput = None
+        self.latency = 0.0
+        self.queued = 0
+        self.written = 0
+        self.lastQueued = 0
+        self.lastSample = time.monotonic()
+
+    def recordSent(self, nbytes: int):
+        """
+        Record bytes handed to the socket
+        """
+        self.written += nbytes
+
+    def sample(self, queued: int) -> float:
+        """
+        Update the estimate with the current send queue depth
+        :param queued: bytes waiting in the socket's send queue
+        :return: estimated latency in seconds
+        """
+        now = time.monotonic()
+        self.queued = queued
+        dt = now - self.lastSample
+
+        if dt >= self.MIN_SAMPLE_INTERVAL:
+            drained = max(0, self.lastQueued + self.written - queued)
+            rate = drained / dt
+            if self.throughput is None:
+                self.throughput = rate
+            else:
+                self.throughput += self.ALPHA * (rate - self.throughput)
+            self.lastQueued = queued
+            self.written = 0
+            self.lastSample = now
+
+        if queued == 0:
+            self.latency = 0.0
+        elif not self.throughput:
+            self.latency = self.MAX_LATENCY
+        else:
+            self.latency = min(self.MAX_LATENCY, queued / self.throughput)
+        return self.latency
+
+    def over_budget(self) -> bool:
+        """
+        Returns True if the estimated latency is over budget
+        """
+        return 0 < self.budget < self.latency
+
+    def reset(self):
+        """
+        Start over, as for a new connection
+        """
+        self.throughput = None
+        self.latency = 0.0
+        self.queued = 0
+        self.written = 0
+        self.lastQueued = 0
+        self.lastSample = time.monotonic()
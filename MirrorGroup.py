@@ -0,0 +1,55 @@
+"""
+MirrorGroup.py - Lets a group of Pixelblazes that show exactly the same thing share
+one set of incoming data and one encoded frame.
+
+The first device in the group is the leader.  Only its universe fragments are routed, so
+incoming data is unpacked once, into the leader's buffer, which the other members share.
+When any member is ready to send, the group encodes a new frame from the leader's buffer
+if there's new data, and every member sends that same message.  Each member still
+has its own connection, frame rate, and statistics.
+"""
+import threading
+
+
+class MirrorGroup:
+    # the leader's universe mapping, which members have to match
+    mapping = None
+
+    def __init__(self, name: str, leader):
+        self.name = name
+        self.leader = leader
+        self.members = [leader]
+        self.lock = threading.Lock()
+        self.version = 0
+        self.message = None
+        leader.join_group(self)
+
+    def add(self, dev):
+        """
+        Add a device to the group.  The device's own universe fragments should not be
+        routed; it gets its data from the leader.
+        """
+        self.members.append(dev)
+        dev.join_group(self)
+        self.leader.nextOutputs += (dev,)
+
+    def latest_frame(self) -> tuple:
+        """
+        Returns the version number and message for the group's most recent frame, encoding a
+        new one first if new data has arrived.  The message is None if nothing has been
+        encoded yet.
+        """
+        with self.lock:
+            src = self.leader
+            synced = src.is_synced()
+            if src.frame_pending(synced):
+                if src.deviceStyle == src.DeviceStyles.Fixture:
+                    frame = src.take_frame(src.channelData, synced)
+                else:
+                    frame = src.take_frame(src.pixels, synced)
+                self.message = src.encode_frame(frame)
+                self.version += 1
+            return self.version, self.message
+
+    def __str__(self):
+        return "MirrorGroup: name: " + self.name + " members: " + ", ".join(dev.name for dev in self.members)
@@ -0,0 +1,235 @@
+"""
+OutputWorkers.py - Spreads display device output across several worker processes, so
+packing and sending frames isn't limited to the one CPU core the router's process
+can use.
+
+The router keeps receiving and routing data as usual, but each device's buffer lives in
+shared memory (see SharedFrame.py).  Each worker process runs its own DisplayDevice objects
+for a share of the devices, reading from those buffers, and posts their status to the
+status board itself.  Members of a mirror group always share a worker, so the group still only
+encodes each frame once.
+
+When a worker's device is idle or waiting for a frame to complete, the router wakes it up
+through a pipe.  The router also passes on Pixelblaze beacons that way, so a worker's
+device can reconnect as soon as its Pixelblaze reappears.  Workers flag their idle
+devices in the shared frames, which lets the router see when everything's idle.
+"""
+import copy
+import logging
+import threading
+import time
+from multiprocessing import Pipe, Process
+
+from ArtnetUtils import getParam
+from AsyncOutputEngine import AsyncOutputEngine
+from ConfigParser import ConfigParser
+from DisplayDevice import DisplayDevice
+from SharedFrame import SharedFrame
+
+
+# messages from the router to a worker start with one of these
+MESSAGE_WAKE = b"w"  # followed by a two byte device slot number
+MESSAGE_BEACON = b"b"  # followed by the Pixelblaze's IP address
+
+
+class OutputWorkerPool:
+    """
+    Router side: creates the shared frames and worker processes, and wakes workers' devices
+    """
+
+    def __init__(self, liveConfig: dict, deviceList: dict, workerCount: int, pd):
+        """
+        :param liveConfig: the project configuration the workers should use
+        :param deviceList: the router's DisplayDevice objects, keyed like the config's devices
+        :param workerCount: number of worker processes to run
+        :param pd: ProjectData, for the status queue and flags
+        """
+        self.frames = dict()
+        self.devices = deviceList
+        self.processes = []
+        self.pipes = []
+        self.locks = []
+        # which workers run the devices for each Pixelblaze IP address, for passing on beacons
+        self.workersByIp = dict()
+
+        # the devices that actually receive data, with their mirror group members
+        shards = [[] for _ in range(workerCount)]
+        for n, key in enumerate(k for k in deviceList if self._is_routed(deviceList[k])):
+            dev = deviceList[key]
+            keys = [k for k in deviceList if deviceList[k] in dev.outputs] if dev.group is not None else [key]
+            shards[n % workerCount].append((key, keys))
+
+        # workers post status to the same status board slots the router would use
+        statusSlots = {key: slot for slot, key in enumerate(deviceList)}
+
+        for index, shard in enumerate(shards):
+            if len(shard) == 0:
+                continue
+            receiver, sender = Pipe(duplex=False)
+            lock = threading.Lock()
+            names = dict()
+            slots = dict()
+            for slot, (key, keys) in enumerate(shard):
+                dev = deviceList[key]
+                frame = SharedFrame(dev.pixelCount, dev.deviceStyle == dev.DeviceStyles.Fixture)
+                frame.wake = self._make_waker(sender, lock, slot)
+                dev.publish_frame(frame)
+                self.frames[key] = frame
+                names[key] = (frame.name, keys)
+                for k in keys:
+                    slots[k] = statusSlots[k]
+                    self.workersByIp.setdefault(deviceList[k].ip, set()).add(len(self.pipes))
+
+            proc = Process(target=worker_process, name="OutputWorker%d" % index,
+                           args=(index, liveConfig, names, slots, receiver, pd.statusBoard, pd.ui_is_active,
+                                 pd.exit_flag))
+            proc.daemon = True
+            proc.start()
+            self.processes.append(proc)
+            self.pipes.append(sender)
+            self.locks.append(lock)
+
+        logging.debug("Started %d output worker processes" % len(self.processes))
+
+    @staticmethod
+    def _is_routed(dev) -> bool:
+        return dev.group is None or dev.group.leader is dev
+
+    @staticmethod
+    def _make_waker(sender, lock, slot: int):
+        """
+        Returns a function that wakes up a worker's device.  Both the Art-Net and sACN
+        threads can call it, so writes to the pipe are serialized.
+        """
+        message = MESSAGE_WAKE + slot.to_bytes(2, "little")
+
+        def wake():
+            OutputWorkerPool._send(sender, lock, message)
+
+        return wake
+
+    @staticmethod
+    def _send(sender, lock, message: bytes):
+        with lock:
+            try:
+                sender.send_bytes(message)
+            except (OSError, ValueError):
+                # worker's gone
+                pass
+
+    def beacon_seen(self, ip: str):
+        """
+        Pass a Pixelblaze beacon on to the workers running that Pixelblaze's devices
+        """
+        for index in self.workersByIp.get(ip, ()):
+            self._send(self.pipes[index], self.locks[index], MESSAGE_BEACON + ip.encode())
+
+    def all_idle(self) -> bool:
+        """
+        Returns True if every worker's devices have gone idle
+        """
+        return all(frame.is_idle() for frame in self.frames.values())
+
+    def stop(self):
+        """
+        Shut down the workers, which watch the exit flag, and free the shared memory
+        """
+        for pipe in self.pipes:
+            pipe.close()
+        for proc in self.processes:
+            proc.join(2)
+            if proc.is_alive():
+                proc.terminate()
+        for key in self.frames:
+            self.devices[key].detach_frame()
+            self.frames[key].close()
+        logging.debug("Output workers stopped")
+
+
+class OutputWorker:
+    """
+    Worker side: runs a share of the display devices, sending data from shared frames
+    """
+
+    def __init__(self, index: int, liveConfig: dict, names: dict, slots: dict, receiver, statusBoard, ui_is_active,
+                 exit_flag):
+        self.index = index
+        self.receiver = receiver
+
+        # build devices for our share of the project, without starting them
+        keys = [k for key in names for k in names[key][1]]
+        config = copy.deepcopy(liveConfig)
+        outputEngine = getParam(config["system"], "outputEngine", "threads")
+        config["system"]["outputEngine"] = "workers"
+        config["devices"] = {k: config["devices"][k] for k in keys}
+        systemSettings, self.deviceList, _ = ConfigParser().parse(config)
+
+        # hook them up to the router's shared frames
+        self.frames = []
+        self.slots = []
+        for key in names:
+            dev = self.deviceList[key]
+            frame = SharedFrame(dev.pixelCount, dev.deviceStyle == dev.DeviceStyles.Fixture, names[key][0])
+            dev.subscribe_frame(frame)
+            self.frames.append(frame)
+            self.slots.append(dev)
+
+        # and start them up
+        engine = None
+        if outputEngine == "asyncio":
+            engine = AsyncOutputEngine()
+            for key in self.deviceList:
+                engine.addDevice(self.deviceList[key])
+        else:
+            for key in self.deviceList:
+                self.deviceList[key].start_thread()
+
+        threading.Thread(target=self._listen, daemon=True).start()
+
+        # report status 'till it's time to go
+        sleep_time = systemSettings['statusUpdateIntervalMs'] / 1000
+        notifyTimer = time.monotonic()
+        while not exit_flag.wait(sleep_time):
+            elapsedTime = time.monotonic() - notifyTimer
+            notifyTimer = time.monotonic()
+            for key in self.deviceList:
+                dev = self.deviceList[key]
+                if ui_is_active.is_set():
+                    statusBoard.set_device(slots[key], dev.getStatus(elapsedTime))
+                dev.resetCounters()
+
+        if engine is not None:
+            engine.stop()
+        DisplayDevice.stop_all(self.deviceList.values())
+        for dev, frame in zip(self.slots, self.frames):
+            dev.detach_frame()
+            frame.close()
+
+    def _listen(self):
+        """
+        Wake up devices, and pass on beacons, when the router asks us to
+        """
+        while True:
+            try:
+                message = self.receiver.recv_bytes()
+            except (EOFError, OSError):
+                break
+            if message[:1] == MESSAGE_WAKE:
+                self.slots[int.from_bytes(message[1:], "little")].wake()
+            elif message[:1] == MESSAGE_BEACON:
+                ip = message[1:].decode()
+                for dev in self.deviceList.values():
+                    if dev.ip == ip:
+                        dev.beacon_seen()
+
+
+def worker_process(index: int, liveConfig: dict, names: dict, slots: dict, receiver, statusBoard, ui_is_active,
+                   exit_flag):
+    """
+    Entry point for an output worker process
+    """
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-6s: %(message)s',
+        level=logging.DEBUG,
+        datefmt='%Y-%m-%d %H:%M:%S')
+    OutputWorker(index, liveConfig, names, slots, receiver, statusBoard, ui_is_active, exit_flag)
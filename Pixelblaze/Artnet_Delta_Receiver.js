@@ -0,0 +1,61 @@
+// Delta frame receiver for use with Flamecaster Art-Net to Pixelblaze router.
+// Use with devices whose transport is set to "delta".
+//
+// Flamecaster sends a full frame in "pixels" now and then (a keyframe), and
+// in between sends only the pixels that differ from the keyframe, as a list of runs
+// in "changes":  startIndex, count, value, value, ...
+// Each list holds every change since the keyframe, so if a new one arrives before
+// we've rendered the last, we only need the new one.  "changeId" is bumped for every
+// new list, and "keyframeId" for every keyframe, so we only apply each one once.
+export var pixels = array(pixelCount)
+export var changes = array(pixelCount)
+export var changeCount = 0
+export var changeId = 0
+export var keyframeId = 0
+
+// our copy of the last keyframe, and the pixels the current change list moved away from it
+var keyframe = array(pixelCount)
+var touched = array(pixelCount)
+var touchedCount = 0
+var appliedId = -1
+var appliedKeyframe = -1
+
+export function beforeRender(delta) {
+  if (keyframeId != appliedKeyframe) {
+    appliedKeyframe = keyframeId
+    for (var k = 0; k < pixelCount; k++) {
+      keyframe[k] = pixels[k]
+    }
+    touchedCount = 0
+    appliedId = -1
+  }
+
+  if (changeId != appliedId) {
+    appliedId = changeId
+
+    // start over from the keyframe, then apply the new list
+    for (var k = 0; k < touchedCount; k++) {
+      pixels[touched[k]] = keyframe[touched[k]]
+    }
+    touchedCount = 0
+
+    var i = 0
+    while (i < changeCount) {
+      var start = changes[i]
+      var n = changes[i + 1]
+      i += 2
+      for (var j = 0; j < n; j++) {
+        pixels[start + j] = changes[i + j]
+        touched[touchedCount] = start + j
+        touchedCount += 1
+      }
+      i += n
+    }
+  }
+}
+
+export function render(index) {
+  var p = pixels[index]
+  r = (p >> 8) & 0xff; g = p & 0xff; b = (p * 256 + .5) & 0xff
+  rgb(r /255, g/255, b/255)
+}
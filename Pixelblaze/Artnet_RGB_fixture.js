@@ -3,11 +3,55 @@
 // 1 - Red
 // 2 - Green
 // 3 - Blue
-export var channels = array(3)
+//
+// Works with either transport.  With "full", Flamecaster sends all the channels
+// in "channels".  With "delta", it sends all the channels now and then (a keyframe),
+// and in between sends only the channels that differ from the keyframe, as pairs in
+// "channelChanges":  channel, value, channel, value, ...
+// Each list holds every change since the keyframe, so if a new one arrives before
+// we've rendered the last, we only need the new one.  "channelChangeId" is bumped for
+// every new list, and "channelKeyframeId" for every keyframe, so we only apply each one once.
+var NUM_CHANNELS = 3
+export var channels = array(NUM_CHANNELS)
+export var channelChanges = array(2 * NUM_CHANNELS)
+export var channelChangeCount = 0
+export var channelChangeId = 0
+export var channelKeyframeId = 0
+
+// our copy of the last keyframe, and the channels the current change list moved away from it
+var keyframe = array(NUM_CHANNELS)
+var touched = array(NUM_CHANNELS)
+var touchedCount = 0
+var appliedId = -1
+var appliedKeyframe = -1
 
 var r,g,b
 export function beforeRender(delta) {
-  
+  if (channelKeyframeId != appliedKeyframe) {
+    appliedKeyframe = channelKeyframeId
+    for (var k = 0; k < NUM_CHANNELS; k++) {
+      keyframe[k] = channels[k]
+    }
+    touchedCount = 0
+    appliedId = -1
+  }
+
+  if (channelChangeId != appliedId) {
+    appliedId = channelChangeId
+
+    // start over from the keyframe, then apply the new list
+    for (var k = 0; k < touchedCount; k++) {
+      channels[touched[k]] = keyframe[touched[k]]
+    }
+    touchedCount = 0
+
+    for (var i = 0; i < channelChangeCount; i++) {
+      channels[channelChanges[2 * i]] = channelChanges[2 * i + 1]
+      touched[touchedCount] = channelChanges[2 * i]
+      touchedCount += 1
+    }
+  }
+
   // first 3 channels are color data
   r = channels[0] / 255
   g = channels[1] / 255
@@ -16,4 +60,4 @@ export function beforeRender(delta) {
 
 export function render(index) {
   rgb(r,g,b)
-}
\ No newline at end of file
+}
@@ -0,0 +1,14 @@
+// Receiver for use with Flamecaster Art-Net to Pixelblaze router.
+// Use with devices whose encoding is set to "rgb444x2".
+//
+// Each value holds two pixels, with 4 bits each of red, green and blue.
+// Even pixels are in the integer part, odd pixels in the top 12 bits of
+// the fraction.
+export var pixels = array(ceil(pixelCount / 2))
+
+export function render(index) {
+  var p = pixels[index >> 1]
+  if (index & 1) p = p << 12
+  r = (p >> 8) & 0xf; g = (p >> 4) & 0xf; b = p & 0xf
+  rgb(r / 15, g / 15, b / 15)
+}
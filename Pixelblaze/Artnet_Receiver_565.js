@@ -0,0 +1,11 @@
+// Receiver for use with Flamecaster Art-Net to Pixelblaze router.
+// Use with devices whose encoding is set to "rgb565".
+//
+// Each pixel is a 16-bit integer: 5 bits red, 6 bits green, 5 bits blue.
+export var pixels = array(pixelCount)
+
+export function render(index) {
+  var p = pixels[index]
+  r = (p >> 11) & 0x1f; g = (p >> 5) & 0x3f; b = p & 0x1f
+  rgb(r / 31, g / 63, b / 31)
+}
@@ -1,8 +1,7 @@
 import socket
 import struct
-import time
 import threading
-from ArtnetUtils import time_in_millis
+from ArtnetUtils import time_in_millis, wake_udp_listener
 
 
 class PixelblazeEnumerator:
@@ -25,14 +24,17 @@ class PixelblazeEnumerator:
     devices = dict()
     autoSync = False
 
-    def __init__(self, hostIP="0.0.0.0"):
+    def __init__(self, hostIP="0.0.0.0", beaconCallback=None):
         """
         Create an object that listens continuously for Pixelblaze beacon
         packets, maintains a list of Pixelblazes and supports synchronizing time
         on multiple Pixelblazes to allows them to run patterns simultaneously.
         Takes the IPv4 address of the interface to use for listening on the calling computer.
         Listens on all available interfaces if hostIP is not specified.
+        If beaconCallback is specified, it is called with the sender's IP address
+        whenever a beacon arrives.
         """
+        self.beaconCallback = beaconCallback
         self.start(hostIP)
 
     def __del__(self):
@@ -96,8 +98,10 @@ class PixelblazeEnumerator:
             self.listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.listener.bind((hostIP, self.PORT))
+            # wake up now and then, so stop() doesn't wait forever for a packet
+            self.listener.settimeout(1)
 
-            self.threadObj = threading.Thread(target=self._listen)
+            self.threadObj = threading.Thread(target=self._listen, daemon=True)
             self.isRunning = True
             self.listTimeoutCheck = 0
             self.threadObj.start()
@@ -116,8 +120,11 @@ class PixelblazeEnumerator:
             return
         else:
             self.isRunning = False
-            self.threadObj.join()
-            time.sleep(0.5)
+            # wake the listener thread up, rather than waiting for its socket to time out.
+            # If it's the listener thread calling, it'll see the flag when it gets back to its loop.
+            if self.threadObj is not None and self.threadObj is not threading.current_thread():
+                wake_udp_listener(self.listener)
+                self.threadObj.join()
             self.listener.close()
             self.threadObj = None
             self.listener = None
@@ -139,7 +146,12 @@ class PixelblazeEnumerator:
         """
 
         while self.isRunning:
-            data, addr = self.listener.recvfrom(1024)
+            try:
+                data, addr = self.listener.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
             now = time_in_millis()
 
             # check the list periodically,and remove devices we haven't seen in a while
@@ -155,10 +167,14 @@ class PixelblazeEnumerator:
 
             # when we receive a beacon packet from a Pixelblaze,
             # update device record and timestamp in our device list
-            pkt = self._unpack_beacon(data)
+            if len(data) < 12:
+                continue
+            pkt = self._unpack_beacon(data[:12])
             if pkt[0] == self.BEACON_PACKET:
                 # add pixelblaze to list of devices
                 self.devices[pkt[1]] = {"address": addr, "timestamp": now, "sender_id": pkt[1], "sender_time": pkt[2]}
+                if self.beaconCallback is not None:
+                    self.beaconCallback(addr[0])
 
                 # immediately send timesync if enabled
                 if self.autoSync:  # send
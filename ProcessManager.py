@@ -1,7 +1,11 @@
+import copy
+import logging
+import queue
 import time
 from multiprocessing import Process
 
 from ArtnetRouter import ArtnetRouter
+from ConfigParser import ConfigParser
 from ProjectData import ProjectData
 
 
@@ -17,18 +21,47 @@ def mirror_process(pd: ProjectData):
 
 def stopArtnetRouter(pd: ProjectData):
     pd.exit_flag.set()
+    # wake the router up, so it doesn't finish its nap first
+    pd.cmdQueue.put({"stop": True})
     pd.routerProcess.join()
 
 def startArtnetRouter(pd: ProjectData):
     pd.exit_flag.clear()
     pd.ui_is_active.clear()
 
+    # don't hand the new router anything meant for the old one
+    try:
+        while True:
+            pd.cmdQueue.get_nowait()
+    except queue.Empty:
+        pass
+
     pd.routerProcess = Process(target=mirror_process, name="ArtnetRouter", args=(pd,))
-    pd.routerProcess.daemon = True
+    # daemon processes can't start processes of their own, so if the router's going to
+    # run output workers, it can't be one.
+    system = pd.liveConfig.get("system", dict())
+    pd.routerProcess.daemon = system.get("outputWorkers", 0) == 0
+    # remember what the router's running, so we know what a reload has to change
+    pd.routerConfig = copy.deepcopy(pd.liveConfig)
     pd.startTime = time.time()
     pd.routerProcess.start()
 
 def restartArtnetRouter(pd: ProjectData):
+    t = time.monotonic()
     stopArtnetRouter(pd)
-    time.sleep(1)
-    startArtnetRouter(pd)
\ No newline at end of file
+    startArtnetRouter(pd)
+    logging.info("Artnet router restarted in %.1f ms" % (1000 * (time.monotonic() - t)))
+
+def reloadArtnetRouter(pd: ProjectData):
+    """
+    Switch the running router to the current live configuration.  If nothing that needs a
+    restart has changed, the router reloads it in place, and devices whose settings are
+    the same stay connected.  Otherwise, restart the router.
+    """
+    if (pd.routerProcess is None or not pd.routerProcess.is_alive() or
+            ConfigParser.requiresRestart(pd.routerConfig, pd.liveConfig)):
+        restartArtnetRouter(pd)
+        return
+
+    pd.routerConfig = copy.deepcopy(pd.liveConfig)
+    pd.cmdQueue.put({"reloadConfig": pd.routerConfig})
@@ -4,6 +4,7 @@ from multiprocessing import Event, Queue
 from typing import Union
 
 from ConfigParser import ConfigParser
+from StatusBoard import StatusBoard
 
 
 """
@@ -16,11 +17,12 @@ class ProjectData:
         self.editableConfig = None
         self.projectFile = None
         self.routerProcess = None
+        self.routerConfig = None
         self.startTime = 0
         self.bytesIn = 0
         self.bytesOut = 0
         self.cmdQueue = Queue()
-        self.dataQueue = Queue()
+        self.statusBoard = StatusBoard()
         self.exit_flag = Event()
         self.ui_is_active = Event()
 
@@ -0,0 +1,97 @@
+"""
+RateController.py - Closed loop frame rate control for a single display device.
+
+Watches how long each websocket send takes, how much data is still waiting in the
+socket's send queue, and the frame rate the Pixelblaze says it's rendering at, and
+adjusts the device's outgoing frame rate to match what the link and the Pixelblaze
+can actually handle.  The rate backs off quickly when there are signs of congestion,
+and creeps back up toward the configured maximum when things are going well.
+"""
+import json
+import time
+
+
+class RateController:
+    # how often, in seconds, to reevaluate the frame rate
+    UPDATE_INTERVAL = 1.0
+    # multiplicative decrease when congested, additive increase (fps) when not
+    BACKOFF = 0.75
+    STEP_UP = 1.0
+    # a send that takes more than this fraction of the frame time means we're congested
+    SEND_TIME_LIMIT = 0.5
+    # more than this many frames' worth of data waiting to go out means we're congested
+    QUEUE_FRAMES_LIMIT = 2.0
+    # don't send frames much faster than the Pixelblaze is rendering them
+    RENDER_HEADROOM = 1.1
+
+    def __init__(self, maxFps: float, minFps: float = 5):
+        self.maxFps = maxFps
+        self.minFps = min(minFps, maxFps)
+        self.targetFps = maxFps
+        self.lastUpdate = time.monotonic()
+        self.lastStats = None
+        self.renderFps = None
+        self._reset_measurements()
+
+    def _reset_measurements(self):
+        self.sends = 0
+        self.sendTime = 0.0
+        self.maxSendTime = 0.0
+        self.bytesSent = 0
+        self.maxQueued = 0
+
+    def observeSend(self, duration: float, size: int, queued: int):
+        """
+        Record a completed send.
+        :param duration: time spent in the send call, in seconds
+        :param size: size of the message, in bytes
+        :param queued: bytes still waiting in the socket's send queue afterwards
+        """
+        self.sends += 1
+        self.sendTime += duration
+        self.maxSendTime = max(self.maxSendTime, duration)
+        self.bytesSent += size
+        self.maxQueued = max(self.maxQueued, queued)
+
+    def observeStats(self, stats: str):
+        """
+        Pick up the render frame rate from the Pixelblaze's latest stats message,
+        if it's new.
+        :param stats: JSON stats string, as saved by Pixelblaze.wsReceive
+        """
+        if stats is None or stats is self.lastStats:
+            return
+        self.lastStats = stats
+        try:
+            self.renderFps = float(json.loads(stats).get("fps"))
+        except (ValueError, TypeError, AttributeError):
+            self.renderFps = None
+
+    def update(self) -> float:
+        """
+        Reevaluate the target frame rate if it's time.
+        :return: the current target frame rate
+        """
+        now = time.monotonic()
+        if now - self.lastUpdate < self.UPDATE_INTERVAL:
+            return self.targetFps
+        self.lastUpdate = now
+
+        if self.sends > 0:
+            frameTime = 1 / self.targetFps
+            avgSize = self.bytesSent / self.sends
+            congested = (self.sendTime / self.sends > self.SEND_TIME_LIMIT * frameTime or
+                         self.maxQueued > self.QUEUE_FRAMES_LIMIT * avgSize)
+
+            if congested:
+                self.targetFps *= self.BACKOFF
+            else:
+                self.targetFps += self.STEP_UP
+
+        ceiling = self.maxFps
+        if self.renderFps is not None and self.renderFps > 0:
+            ceiling = min(ceiling, self.renderFps * self.RENDER_HEADROOM)
+
+        self.targetFps = max(self.minFps, min(ceiling, self.targetFps))
+        self._reset_measurements()
+        return self.targetFps
@@ -0,0 +1,342 @@
+"""
+SacnServer.py - Provides a super simplified sACN (E1.31) receiver implementation
+specifically for this project.
+
+Listens for sACN data on the universes our devices use, joining their multicast
+groups, and feeds it to the same dispatcher as the Art-Net server.  sACN universe
+numbers map directly to Art-Net port addresses, so sACN universe 1 is delivered to
+fragments configured for universe 1 (net 0, subnet 0, universe 1).
+"""
+
+import errno
+import logging
+import socket
+import struct
+import time
+from threading import Lock, Thread
+
+from ArtnetUtils import wake_udp_listener
+from SequenceTracker import SequenceTracker
+
+
+class SacnSource:
+    """
+    The source we're currently taking a universe's data from
+    """
+    __slots__ = ("cid", "priority", "lastSeen")
+
+    def __init__(self, cid: bytes, priority: int, lastSeen: float):
+        self.cid = cid
+        self.priority = priority
+        self.lastSeen = lastSeen
+
+
+class SacnServer:
+    """
+      SacnServer - Extremely simple sACN receiver.
+
+      Like ArtnetServer, we don't do callbacks per universe.  We pass everything we
+      route to a single callback, along with its universe address.
+
+      When more than one source sends the same universe, we take data from the highest
+      priority source, and stick with the first one we heard from if priorities are
+      equal.  (No HTP merging.)  If the current source stops sending, any other source
+      can take over after SOURCE_TIMEOUT seconds.
+    """
+    UDP_PORT = 5568
+    SOURCE_TIMEOUT = 2.5
+
+    BUFFER_SIZE = 1144
+    BUFFER_POOL_SIZE = 4
+
+    # how long close() waits for the listener thread
+    SHUTDOWN_TIMEOUT = 0.5
+
+    # E1.31 packet layouts.  We only unpack the fields we actually use.
+    ACN_PACKET_IDENTIFIER = b'ASC-E1.17\x00\x00\x00'
+    VECTOR_ROOT_E131_DATA = 0x00000004
+    VECTOR_ROOT_E131_EXTENDED = 0x00000008
+    VECTOR_E131_DATA_PACKET = 0x00000002
+    VECTOR_E131_EXTENDED_SYNCHRONIZATION = 0x00000001
+    VECTOR_DMP_SET_PROPERTY = 0x02
+
+    OPTION_PREVIEW_DATA = 0x80
+    OPTION_STREAM_TERMINATED = 0x40
+
+    # preamble, postamble, ACN packet identifier, flags & length, vector, CID
+    ROOT_LAYER = struct.Struct("!4x12s2xI16s")
+    # flags & length, vector, source name, priority, sync address, sequence, options, universe
+    FRAMING_LAYER = struct.Struct("!2xI64xBHBBH")
+    FRAMING_OFFSET = 38
+    # flags & length, vector, address type, first address, increment, property value count, start code
+    DMP_LAYER = struct.Struct("!2xBB4xHB")
+    DMP_OFFSET = 115
+    DMX_OFFSET = 126
+    # root layer plus the framing layer's vector -- all we need to tell data from sync packets
+    MIN_PACKET_SIZE = 44
+
+    socket_server = None
+    callback = None
+    syncCallback = None
+    sequencer = None
+
+    def __init__(self, listen_ip: str, udp_port: int, universes, callback, zeroCopy: bool = True,
+                 syncCallback=None):
+        """
+        Initializes sACN server.
+        :param listen_ip: IP address of the interface to listen on.  0.0.0.0 for all interfaces.
+        :param udp_port: UDP port to listen on.  Should be 5568 unless you have a very good reason.
+        :param universes: container of the universe addresses we route.  We join multicast groups
+        for these, and drop packets for any others.
+        :param callback: function to call with (address, data) for each packet
+        :param zeroCopy: if True, receive into a buffer pool and pass memoryviews to the
+        callback.  If False, each packet's DMX data is copied into a new bytearray.
+        :param syncCallback: optional function, called with no arguments when an E1.31
+        synchronization packet arrives.
+        """
+        self.listen = True
+        self.callback = callback
+        self.syncCallback = syncCallback
+        self.listen_ip = listen_ip
+        self.UDP_PORT = udp_port
+        self.subscribed = universes
+        self.zeroCopy = zeroCopy
+        self.sequencer = SequenceTracker(modulus=256, zeroDisables=False)
+        self.sources = dict()
+        self.memberships = dict()
+        self.membershipSockets = []
+        self.membershipLock = Lock()
+
+        self.server_thread = Thread(target=self.__init_socket, daemon=True)
+        self.server_thread.start()
+
+    @staticmethod
+    def multicast_group(universe: int) -> str:
+        """
+        Returns the multicast group address for an sACN universe
+        """
+        return "239.255.%d.%d" % ((universe >> 8) & 0xFF, universe & 0xFF)
+
+    def setSubscribed(self, universes):
+        """
+        Switch to a new set of universes, joining and leaving multicast groups to match.
+        :param universes: container of the universe addresses we route
+        """
+        self.subscribed = universes
+        self.update_memberships()
+
+    def update_memberships(self):
+        """
+        Join the multicast groups for the universes we route, and leave any others
+        """
+        with self.membershipLock:
+            if self.socket_server is None or not self.listen:
+                # the server thread will take care of it when the socket's ready
+                return
+            # valid sACN universes are 1-63999
+            wanted = set(u for u in self.subscribed if 1 <= u <= 63999)
+            for universe in set(self.memberships) - wanted:
+                self.drop_membership(universe)
+            for universe in wanted - set(self.memberships):
+                self.add_membership(universe)
+
+    def membership_request(self, universe: int) -> bytes:
+        """
+        Returns the ip_mreq structure for joining or leaving a universe's multicast group
+        """
+        return socket.inet_aton(self.multicast_group(universe)) + socket.inet_aton(self.listen_ip)
+
+    def add_membership(self, universe: int):
+        """
+        Join a universe's multicast group.  Linux limits the number of groups a socket can
+        join (net.ipv4.igmp_max_memberships, 20 by default), so when the sockets we have
+        are full, we open another one just to hold memberships.  The listening socket
+        still gets the data, since Linux delivers a group's packets to every socket bound
+        to the port, no matter which socket joined the group.
+        If we can't join at all, we log it and carry on.  Unicast sACN still works.
+        """
+        mreq = self.membership_request(universe)
+        for sock in [self.socket_server] + self.membershipSockets + [None]:
+            fresh = sock is None
+            if fresh:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+            except OSError as e:
+                if e.errno == errno.ENOBUFS and not fresh:
+                    # this socket's full, try the next one
+                    continue
+                if fresh:
+                    sock.close()
+                logging.warning("sACN: can't join multicast group %s for universe %d: %s" %
+                                (self.multicast_group(universe), universe, e))
+                return
+            if fresh:
+                self.membershipSockets.append(sock)
+            self.memberships[universe] = sock
+            return
+
+    def drop_membership(self, universe: int):
+        """
+        Leave a universe's multicast group
+        """
+        sock = self.memberships.pop(universe)
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_DROP_MEMBERSHIP, self.membership_request(universe))
+        except OSError as e:
+            logging.warning("sACN: can't leave multicast group %s for universe %d: %s" %
+                            (self.multicast_group(universe), universe, e))
+
+    def __init_socket(self):
+        """Initializes server socket and joins multicast groups for our universes."""
+        self.socket_server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket_server.setsockopt(
+            socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        # multicast traffic won't be delivered to a socket bound to a specific unicast
+        # address on most platforms, so we bind to all interfaces, and use the listen
+        # address to select the interface for multicast.
+        self.socket_server.bind(("", self.UDP_PORT))
+
+        self.update_memberships()
+
+        pool = [bytearray(self.BUFFER_SIZE) for _ in range(self.BUFFER_POOL_SIZE)]
+        views = [memoryview(buf) for buf in pool]
+        poolIndex = 0
+
+        while self.listen:
+
+            try:
+                if self.zeroCopy:
+                    nbytes, sender = self.socket_server.recvfrom_into(pool[poolIndex])
+                    data = views[poolIndex][:nbytes]
+                    poolIndex = (poolIndex + 1) % self.BUFFER_POOL_SIZE
+                else:
+                    data, sender = self.socket_server.recvfrom(self.BUFFER_SIZE)
+            except OSError:
+                # socket's been closed
+                break
+
+            # too short to be E1.31. close() sends an empty packet to wake us up.
+            if len(data) < self.MIN_PACKET_SIZE:
+                continue
+
+            # whatever arrives, a bad packet mustn't take the listener down with it
+            try:
+                self.process_packet(data)
+            except Exception as e:
+                logging.warning("sACN: error processing packet from %s: %s" % (sender[0], e))
+
+    def process_packet(self, data):
+        """
+        Check a packet's root layer and dispatch it by vector
+        :param data: the packet, at least MIN_PACKET_SIZE bytes long
+        """
+        identifier, rootVector, cid = self.ROOT_LAYER.unpack_from(data)
+        if identifier != self.ACN_PACKET_IDENTIFIER:
+            return
+
+        if rootVector == self.VECTOR_ROOT_E131_DATA:
+            self.process_data_packet(data, cid)
+
+        elif rootVector == self.VECTOR_ROOT_E131_EXTENDED:
+            # sync packets carry the framing layer vector right after its flags & length
+            vector = int.from_bytes(data[40:44], byteorder='big')
+            if vector == self.VECTOR_E131_EXTENDED_SYNCHRONIZATION and self.syncCallback is not None:
+                self.syncCallback()
+
+    def process_data_packet(self, data, cid: bytes):
+        """
+        Validate an E1.31 data packet, pick the source we're listening to for its universe,
+        check its sequence number, and pass its DMX data to the callback.
+        """
+        if len(data) <= self.DMX_OFFSET:
+            return
+
+        vector, priority, syncAddress, sequence, options, universe = \
+            self.FRAMING_LAYER.unpack_from(data, self.FRAMING_OFFSET)
+        if vector != self.VECTOR_E131_DATA_PACKET or options & self.OPTION_PREVIEW_DATA:
+            return
+
+        if universe not in self.subscribed:
+            return
+
+        dmpVector, addressType, valueCount, startCode = self.DMP_LAYER.unpack_from(data, self.DMP_OFFSET)
+        if dmpVector != self.VECTOR_DMP_SET_PROPERTY or startCode != 0:
+            return
+
+        if not self.select_source(universe, cid, priority, options):
+            return
+
+        if not self.sequencer.accept(universe, sequence):
+            return
+
+        # property value count includes the start code
+        end = min(len(data), self.DMX_OFFSET + valueCount - 1)
+        if self.zeroCopy:
+            self.callback(universe, data[self.DMX_OFFSET:end])
+        else:
+            self.callback(universe, bytearray(data[self.DMX_OFFSET:end]))
+
+    def select_source(self, universe: int, cid: bytes, priority: int, options: int) -> bool:
+        """
+        Decide whether to take a universe's data from this packet's source.
+        :return: True if the packet is from the source we're listening to
+        """
+        now = time.monotonic()
+        current = self.sources.get(universe)
+
+        if current is not None and current.cid == cid:
+            if options & self.OPTION_STREAM_TERMINATED:
+                del self.sources[universe]
+                self.sequencer.reset(universe)
+                return False
+            current.priority = priority
+            current.lastSeen = now
+            return True
+
+        if options & self.OPTION_STREAM_TERMINATED:
+            return False
+
+        # take over the universe if it's unclaimed, if this source has higher
+        # priority, or if the current source has gone quiet.
+        if current is None or priority > current.priority or now - current.lastSeen > self.SOURCE_TIMEOUT:
+            self.sources[universe] = SacnSource(bytes(cid), priority, now)
+            self.sequencer.reset(universe)
+            return True
+
+        return False
+
+    def getUniverseStatistics(self, reset: bool = True) -> dict:
+        """
+        Returns per-universe counts of received, reordered, duplicated and lost packets
+        :param reset: if True, zero the counters after reading them
+        """
+        return self.sequencer.getStatistics(reset)
+
+    def __del__(self):
+        """Graceful shutdown."""
+        self.close()
+
+    def __str__(self):
+        """Printable object state."""
+        state = "===================================\n"
+        state += "SacnServer Listening\n"
+        return state
+
+    def close(self):
+        """Stop the listener thread and close the UDP socket."""
+        if not self.listen:
+            return
+        self.listen = False
+        # the thread's probably waiting for a packet, so send it one
+        if self.socket_server is not None:
+            wake_udp_listener(self.socket_server)
+        self.server_thread.join(self.SHUTDOWN_TIMEOUT)
+        if self.socket_server is not None:
+            self.socket_server.close()
+        with self.membershipLock:
+            for sock in self.membershipSockets:
+                sock.close()
+            self.membershipSockets = []
+            self.memberships = dict()
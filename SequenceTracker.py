@@ -0,0 +1,139 @@
+"""
+SequenceTracker.py - Per-universe packet sequence tracking for Flamecaster's
+receivers.
+
+Art-Net and sACN both carry an 8-bit sequence number that lets a receiver detect
+packets that were duplicated, arrived late, or went missing.  We keep a small
+sequence window for every universe, drop packets that are older than the most recent
+one we've accepted, and count what happened so the status feed can show it.
+"""
+import time
+
+
+class UniverseSequence:
+    """
+    Sequence state and statistics for a single universe
+    """
+    __slots__ = ("last", "lastTime", "rejectRun", "received", "reordered", "duplicated", "lost")
+
+    def __init__(self):
+        self.last = None
+        self.lastTime = 0
+        self.rejectRun = 0
+        self.received = 0
+        self.reordered = 0
+        self.duplicated = 0
+        self.lost = 0
+
+    def resetCounters(self):
+        self.received = 0
+        self.reordered = 0
+        self.duplicated = 0
+        self.lost = 0
+
+
+class SequenceTracker:
+    """
+    Tracks sequence numbers for all the universes a receiver handles.
+
+    A packet is dropped if its sequence number is the same as, or slightly behind,
+    the last one accepted for its universe.  Anything further behind than WINDOW is
+    taken to mean that the sender has restarted its sequence, so we accept it and start
+    over.  We also start over if we haven't heard from a universe in RESYNC_TIMEOUT seconds,
+    or if we've rejected MAX_REJECT_RUN packets in a row -- after an episode of very heavy
+    loss, or with a sender that doesn't actually increment its sequence numbers,
+    it's better to show the data than to wait for things to sort themselves out.
+    """
+    WINDOW = 20
+    RESYNC_TIMEOUT = 1.0
+    MAX_REJECT_RUN = 8
+
+    def __init__(self, modulus: int = 255, zeroDisables: bool = True):
+        """
+        :param modulus: number of distinct sequence values.  Art-Net counts 1-255 (255 values),
+        sACN counts 0-255 (256 values).
+        :param zeroDisables: if True, a sequence number of zero means the sender isn't
+        sequencing packets (Art-Net), and the packet is always accepted.
+        """
+        self.modulus = modulus
+        self.zeroDisables = zeroDisables
+        self.half = modulus // 2
+        self.universes = dict()
+
+    def accept(self, addr: int, seq: int) -> bool:
+        """
+        Check a packet's sequence number against the universe's sequence window and update
+        the universe's statistics.
+        :param addr: universe address
+        :param seq: packet sequence number
+        :return: True if the packet should be processed, False if it should be dropped
+        """
+        u = self.universes.get(addr)
+        if u is None:
+            u = UniverseSequence()
+            self.universes[addr] = u
+
+        now = time.monotonic()
+        last = u.last
+
+        if seq == 0 and self.zeroDisables:
+            # sender isn't sequencing this universe.
+            u.last = None
+            u.lastTime = now
+            u.received += 1
+            return True
+
+        if last is None or now - u.lastTime > self.RESYNC_TIMEOUT:
+            diff = 1
+        else:
+            # signed distance from the last accepted packet, allowing for wraparound
+            diff = (seq - last) % self.modulus
+            if diff > self.half:
+                diff -= self.modulus
+
+        if diff <= 0 and diff > -self.WINDOW and u.rejectRun < self.MAX_REJECT_RUN:
+            if diff == 0:
+                u.duplicated += 1
+            else:
+                u.reordered += 1
+            u.rejectRun += 1
+            return False
+
+        # anything that gets this far is accepted.  If the sequence jumped forward, we've
+        # lost the packets in between.
+        if diff > 1:
+            u.lost += diff - 1
+
+        # Once we've hit the reject limit, we keep accepting everything until the sender
+        # moves forward again, so a sender that's stuck on one sequence number still works.
+        if diff > 0 or u.rejectRun < self.MAX_REJECT_RUN:
+            u.rejectRun = 0
+
+        u.last = seq
+        u.lastTime = now
+        u.received += 1
+        return True
+
+    def reset(self, addr: int):
+        """
+        Forget the sequence state for a universe, so the next packet starts a new sequence.
+        Statistics are kept.
+        :param addr: universe address
+        """
+        u = self.universes.get(addr)
+        if u is not None:
+            u.last = None
+            u.rejectRun = 0
+
+    def getStatistics(self, reset: bool = True) -> dict:
+        """
+        Return a dictionary of per-universe packet statistics, keyed by universe address
+        :param reset: if True, zero the counters after reading them
+        """
+        stats = dict()
+        for addr, u in list(self.universes.items()):
+            stats[addr] = {"received": u.received, "reordered": u.reordered,
+                           "duplicated": u.duplicated, "lost": u.lost}
+            if reset:
+                u.resetCounters()
+        return stats
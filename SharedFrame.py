@@ -0,0 +1,171 @@
+"""
+SharedFrame.py - A display device's pixel (or channel) buffer in shared memory, so the
+router process can receive data into it while an output worker process sends it.
+
+The segment holds a small header of counters and timestamps, the live buffer that
+incoming packets are written to, and a second buffer for frames latched by ArtSync.
+The router is the only writer.  Each worker device keeps its own copy of the counters
+it last saw, and compares them against the header to find out what's new.
+
+Latched frames are protected by a sequence counter: it's odd while the router is
+writing, and a reader only accepts a copy if the counter was even and unchanged
+across the copy.
+"""
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedFrame:
+    # header layout -- float64s, so timestamps fit
+    HEADER_SIZE = 8
+    UPDATES = 0  # bumped when the live buffer changes
+    PACKETS = 1  # packets received
+    LAST_PACKET = 2  # monotonic time of the last packet
+    COMPLETES = 3  # bumped when all of the device's universes have arrived
+    LAST_COMPLETE = 4  # monotonic time of the last completed frame
+    SYNCS = 5  # latched frame sequence counter
+    LAST_SYNC = 6  # monotonic time of the last ArtSync
+    IDLE = 7  # set by the worker when its device goes idle
+
+    def __init__(self, pixelCount: int, fixture: bool, name: str = None):
+        """
+        Create a new shared frame, or attach to an existing one.
+        :param pixelCount: number of pixels (or channels, for fixtures)
+        :param fixture: True for a fixture's channel buffer, False for packed pixels
+        :param name: name of the shared memory segment to attach to, or None to create one
+        """
+        self.fixture = fixture
+        itemSize = 1 if fixture else 8
+        headerBytes = self.HEADER_SIZE * 8
+        size = headerBytes + 2 * pixelCount * itemSize
+
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.name = self.shm.name
+        self.header = np.ndarray(self.HEADER_SIZE, dtype=np.float64, buffer=self.shm.buf)
+
+        # fixture code works with bytes-like channel buffers, so those are memoryviews
+        if fixture:
+            self.live = self.shm.buf[headerBytes:headerBytes + pixelCount]
+            self.latched = self.shm.buf[headerBytes + pixelCount:headerBytes + 2 * pixelCount]
+        else:
+            self.live = np.ndarray(pixelCount, dtype=np.float64, buffer=self.shm.buf, offset=headerBytes)
+            self.latched = np.ndarray(pixelCount, dtype=np.float64, buffer=self.shm.buf,
+                                      offset=headerBytes + pixelCount * 8)
+
+        # set by the router to a function that wakes the worker's device
+        self.wake = None
+        # a mirror group can collect on behalf of its leader, from another thread
+        self.lock = threading.Lock()
+
+    # --- writer (router process) side
+
+    def publish(self, changed: bool, t: float, complete: bool):
+        """
+        Record a packet written to the live buffer, and wake the worker's device if it's
+        idle, or if the packet completed a frame.
+        :param changed: True if the packet changed the live buffer
+        :param t: monotonic time the packet arrived
+        :param complete: True if the packet completed a frame
+        """
+        h = self.header
+        h[self.PACKETS] += 1
+        h[self.LAST_PACKET] = t
+        if changed:
+            h[self.UPDATES] += 1
+        if complete:
+            h[self.COMPLETES] += 1
+            h[self.LAST_COMPLETE] = t
+        if complete or h[self.IDLE]:
+            h[self.IDLE] = 0
+            if self.wake is not None:
+                self.wake()
+
+    def sync(self, t: float, latch: bool, wake: bool):
+        """
+        Record an ArtSync, and optionally latch a copy of the live buffer
+        :param t: monotonic time of the ArtSync
+        :param latch: True to latch the live buffer
+        :param wake: True to wake the worker's device when a frame is latched
+        """
+        h = self.header
+        if latch:
+            h[self.SYNCS] += 1
+            self.latched[:] = self.live
+            h[self.SYNCS] += 1
+        h[self.LAST_SYNC] = t
+        if latch and wake and self.wake is not None:
+            self.wake()
+
+    # --- reader (worker process) side
+
+    def snapshot(self) -> list:
+        """
+        Returns the current header values, as a starting point for collect()
+        """
+        return self.header.tolist()
+
+    def collect(self, dev, seen: list):
+        """
+        Bring a worker's display device up to date with what the router has received.
+        :param dev: the DisplayDevice
+        :param seen: the device's copy of the header values it last saw.  Updated in place.
+        """
+        with self.lock:
+            self._collect(dev, seen)
+
+    def _collect(self, dev, seen: list):
+        h = self.header.tolist()
+
+        dev.packets_in += int(h[self.PACKETS] - seen[self.PACKETS])
+        dev.lastPacket = h[self.LAST_PACKET]
+        dev.lastSync = h[self.LAST_SYNC]
+        if h[self.UPDATES] != seen[self.UPDATES]:
+            dev.pixelsUpdated += 1
+        if h[self.COMPLETES] != seen[self.COMPLETES]:
+            dev.frameComplete = True
+            dev.lastComplete = h[self.LAST_COMPLETE]
+
+        # take a copy of a newly latched frame, if the router's not in the middle of writing it
+        seq = h[self.SYNCS]
+        if seq != seen[self.SYNCS] and seq % 2 == 0:
+            frame = bytes(self.latched) if self.fixture else self.latched.copy()
+            if self.header[self.SYNCS] == seq:
+                dev.sendFrame = frame
+                dev.sendFlag = True
+            else:
+                h[self.SYNCS] = seen[self.SYNCS]
+        elif seq % 2 == 1:
+            h[self.SYNCS] = seen[self.SYNCS]
+
+        seen[:] = h
+
+    def set_idle(self, idle: bool):
+        self.header[self.IDLE] = 1 if idle else 0
+
+    def is_idle(self) -> bool:
+        """
+        Returns True if the worker's device has gone idle, and no data has arrived since
+        """
+        return self.header[self.IDLE] != 0
+
+    def close(self):
+        """
+        Detach from the shared memory, and free it if we created it
+        """
+        # views into the buffer have to go before it can be closed
+        self.header = None
+        self.live = None
+        self.latched = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # somebody's still holding a view. The memory goes away when the process does.
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
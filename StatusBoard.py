@@ -0,0 +1,176 @@
+"""
+StatusBoard.py - Device and universe status, shared between the router (and output worker)
+processes and the web UI.
+
+The board is a fixed-layout block of shared memory, with one slot for each device and
+each universe.  Writers update their slots in place, and the UI reads whatever's there
+when it's ready to, so there's no queue to fall behind, and nothing to parse.
+
+Each slot has a sequence counter.  It's odd while a writer is updating the slot, and a
+reader only accepts a copy if the counter was even and unchanged across the copy.
+"""
+import logging
+from multiprocessing.sharedctypes import RawArray
+
+import numpy as np
+
+
+class StatusBoard:
+    MAX_DEVICES = 256
+    MAX_UNIVERSES = 1024
+
+    # device slots mirror DisplayDevice.getStatus()
+    DEVICE_FIELDS = [
+        ("name", "S64"),
+        ("ip", "S40"),
+        ("group", "S64"),
+        ("encoding", "S16"),
+        ("state", "S8"),
+        ("connected", "?"),
+        ("synced", "?"),
+        ("inPps", "f8"),
+        ("outFps", "f8"),
+        ("maxFps", "f8"),
+        ("targetFps", "f8"),
+        ("bytesPerFrame", "f8"),
+        ("droppedFrames", "f8"),
+        ("skippedFrames", "f8"),
+        ("latencyMs", "f8"),
+        ("frameMsP50", "f8"),
+        ("frameMsP99", "f8"),
+        ("missedFrames", "f8"),
+        ("suppressedFrames", "f8"),
+    ]
+    UNIVERSE_FIELDS = [
+        ("address", "i8"),
+        ("net", "i8"),
+        ("subnet", "i8"),
+        ("universe", "i8"),
+        ("received", "f8"),
+        ("reordered", "f8"),
+        ("duplicated", "f8"),
+        ("lost", "f8"),
+    ]
+
+    HEADER = np.dtype([("deviceCount", "u8"), ("universeCount", "u8"), ("updates", "u8")])
+    DEVICE = np.dtype([("seq", "u8")] + DEVICE_FIELDS)
+    UNIVERSE = np.dtype([("seq", "u8")] + UNIVERSE_FIELDS)
+
+    # a reader that keeps running into a writer gives up on the slot 'till next time
+    READ_RETRIES = 4
+
+    def __init__(self):
+        """
+        Create a new, empty status board.  Create it before starting the processes
+        that use it, so they inherit it.
+        """
+        size = self.HEADER.itemsize + self.MAX_DEVICES * self.DEVICE.itemsize + \
+            self.MAX_UNIVERSES * self.UNIVERSE.itemsize
+        self.raw = RawArray("B", size)
+        self._map()
+
+    def _map(self):
+        self.header = np.ndarray(1, dtype=self.HEADER, buffer=self.raw)[0]
+        offset = self.HEADER.itemsize
+        self.devices = np.ndarray(self.MAX_DEVICES, dtype=self.DEVICE, buffer=self.raw, offset=offset)
+        offset += self.MAX_DEVICES * self.DEVICE.itemsize
+        self.universes = np.ndarray(self.MAX_UNIVERSES, dtype=self.UNIVERSE, buffer=self.raw, offset=offset)
+        self.warned = False
+
+    # numpy views can't be pickled, so only the shared memory goes along to a new process
+    def __getstate__(self):
+        return {"raw": self.raw}
+
+    def __setstate__(self, state):
+        self.raw = state["raw"]
+        self._map()
+
+    # --- writer side
+
+    def set_device_count(self, count: int):
+        """
+        Set the number of device slots in use.  Slots are numbered from zero.
+        """
+        if count > self.MAX_DEVICES and not self.warned:
+            logging.warning("Status board only has room for %d devices" % self.MAX_DEVICES)
+            self.warned = True
+        self.header["deviceCount"] = min(count, self.MAX_DEVICES)
+
+    def set_device(self, slot: int, status: dict):
+        """
+        Write a device's status to its slot
+        :param slot: the device's slot number
+        :param status: status dictionary, from DisplayDevice.getStatus()
+        """
+        if slot >= self.MAX_DEVICES:
+            return
+        self._write(self.devices, slot, self.DEVICE_FIELDS, status)
+
+    def set_universes(self, stats: dict):
+        """
+        Write per-universe statistics, and set the number of universe slots in use
+        :param stats: dictionary of universe address -> statistics dictionary
+        """
+        for slot, addr in enumerate(list(stats)[:self.MAX_UNIVERSES]):
+            record = dict(stats[addr])
+            record["address"] = addr
+            self._write(self.universes, slot, self.UNIVERSE_FIELDS, record)
+        self.header["universeCount"] = min(len(stats), self.MAX_UNIVERSES)
+
+    def mark_updated(self):
+        """
+        Let readers know there's a new round of status information
+        """
+        self.header["updates"] += 1
+
+    @staticmethod
+    def _write(table, slot: int, fields: list, values: dict):
+        record = table[slot]
+        record["seq"] += 1
+        for name, kind in fields:
+            value = values.get(name)
+            if kind[0] == "S":
+                value = str(value if value is not None else "").encode()[:int(kind[1:])]
+            elif value is None:
+                value = 0
+            record[name] = value
+        record["seq"] += 1
+
+    # --- reader side
+
+    def updates(self) -> int:
+        """
+        Returns a counter that changes whenever there's new status information
+        """
+        return int(self.header["updates"])
+
+    def read_devices(self) -> list:
+        """
+        Returns a list of status dictionaries for the devices on the board
+        """
+        return self._read(self.devices, int(self.header["deviceCount"]))
+
+    def read_universes(self) -> list:
+        """
+        Returns a list of statistics dictionaries for the universes on the board
+        """
+        return self._read(self.universes, int(self.header["universeCount"]))
+
+    def _read(self, table, count: int) -> list:
+        result = []
+        for slot in range(count):
+            for _ in range(self.READ_RETRIES):
+                seq = table["seq"][slot]
+                record = table[slot].copy()
+                if seq % 2 == 0 and record["seq"] == seq and table["seq"][slot] == seq:
+                    result.append(self._to_dict(record))
+                    break
+        return result
+
+    @staticmethod
+    def _to_dict(record) -> dict:
+        values = dict()
+        for name in record.dtype.names[1:]:
+            value = record[name].item()
+            values[name] = value.decode(errors="replace") if isinstance(value, bytes) else value
+        return values
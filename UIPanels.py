@@ -63,13 +63,13 @@ class StatusContainer(Container):
         title.style['font-size'] = '110%'
         self.append(title, 'title')
 
-        table = TableWidget(4, 5, True, False, width="100%", height="100%")
+        table = TableWidget(4, 6, True, False, width="100%", height="55%")
         table.style['position'] = "absolute"
         table.style['overflow'] = "auto"
         table.style['left'] = "0px"
         table.style['top'] = "50px"
 
-        for n in range(5):
+        for n in range(6):
             table.item_at(0, n).style['height'] = uiTextHeight
 
         table.item_at(0, 0).set_text("Name")
@@ -77,9 +77,34 @@ class StatusContainer(Container):
         table.item_at(0, 2).set_text("PPS in")
         table.item_at(0, 3).set_text("FPS out")
         table.item_at(0, 4).set_text("Connected")
+        table.item_at(0, 5).set_text("State")
 
         self.append(table, 'status_table')
 
+        # per-universe packet counts from the receivers, for each status interval
+        title = Label("Universes")
+        title.style['position'] = "absolute"
+        title.style['top'] = "calc(55% + 60px)"
+        title.style['font-size'] = '110%'
+        self.append(title, 'universe_title')
+
+        table = TableWidget(4, 5, True, False, width="100%", height="calc(45% - 100px)")
+        table.style['position'] = "absolute"
+        table.style['overflow'] = "auto"
+        table.style['left'] = "0px"
+        table.style['top'] = "calc(55% + 90px)"
+
+        for n in range(5):
+            table.item_at(0, n).style['height'] = uiTextHeight
+
+        table.item_at(0, 0).set_text("Net:Subnet:Universe")
+        table.item_at(0, 1).set_text("Received")
+        table.item_at(0, 2).set_text("Reordered")
+        table.item_at(0, 3).set_text("Duplicated")
+        table.item_at(0, 4).set_text("Lost")
+
+        self.append(table, 'universe_table')
+
 
 class SystemSettingsContainer(Container):
     def __init__(self, **kwargs):
@@ -1,3 +1,5 @@
+from functools import partial
+
 from ArtnetUtils import *
 
 
@@ -15,6 +17,8 @@ class UniverseFragment:
     startChannel = 0
     destIndex = 0
     pixelCount = 0
+    fragmentBit = 0
+    handler = None
 
     def __init__(self, device, record):
         self.device = device
@@ -30,6 +34,15 @@ class UniverseFragment:
         self.destIndex = getParam(record, "destIndex", 0)
         self.pixelCount = getParam(record, "pixelCount", 0)
 
+        # let the device know this fragment is part of its frame
+        self.fragmentBit = device.register_fragment()
+
+        # prebind the device's packet handler to this fragment's mapping, so the
+        # dispatcher only has to supply the packet data.
+        self.handler = partial(device.process_packet, startChannel=self.startChannel,
+                               destPixel=self.destIndex, count=self.pixelCount,
+                               fragmentBit=self.fragmentBit)
+
     def __str__(self):
         # format the device name and the universe fragment data into a JSON string and return it.
         # instead of address_mask, use net, subnet, universe.
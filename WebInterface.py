@@ -1,10 +1,8 @@
-import json
-
 from remi import App
 from remi.server import Server
 
 from ArtnetUtils import clamp, artnet_to_int
-from ProcessManager import restartArtnetRouter
+from ProcessManager import reloadArtnetRouter
 from UIPanels import *
 
 pd: ProjectData
@@ -82,7 +80,12 @@ class RemiWrapper:
 # noinspection PyUnusedLocal
 class Flamecaster(App):
     status_table = None
+    universe_table = None
+    universeRows = []
     devices = {}
+    universeStats = {}
+    statusUpdates = 0
+    statusRows = []
     baseContainer = None
     statusPanel = None
     systemPanel = None
@@ -92,6 +95,7 @@ class Flamecaster(App):
     def __init__(self, *args):
         super(Flamecaster, self).__init__(*args)
         self.devices = dict()
+        self.universeStats = dict()
 
     def idle(self):
         # if we're here, that means the web server is running.
@@ -99,21 +103,23 @@ class Flamecaster(App):
         # start receiving status updates from the Artnet router
         if not pd.ui_is_active.is_set():
             pd.ui_is_active.set()
-        if not pd.dataQueue.empty():
-            # read the JSON status strings from the queue
-            msg = json.loads(pd.dataQueue.get())
-            # if top level key is "name", it's a device status message
-            if 'name' in msg:
-                # update the device dictionary with the new status
-                self.devices[msg['name']] = msg
-
-            # reconfigure the status table for the updated device list
-            # leave the top row for labels.  The bottom row is blank
-            # because it will expand to fill any remaining space in the
-            #
-            self.status_table.set_row_count(3 + len(self.devices))
-            self.fill_status_table()
-            self.status_table.redraw()
+            # the router may be napping, if it's got nothing to do
+            pd.cmdQueue.put({"uiActive": True})
+        # pick up the latest status from the status board when there's something new
+        updates = pd.statusBoard.updates()
+        if updates != self.statusUpdates:
+            self.statusUpdates = updates
+            self.devices = dict()
+            for status in pd.statusBoard.read_devices():
+                # slots that haven't been filled in yet have no name
+                if status['name'] != "":
+                    self.devices[status['name']] = status
+            # per-universe packet statistics from the Art-Net receiver
+            self.universeStats = {str(u['address']): u for u in pd.statusBoard.read_universes()}
+
+            # remi sends the browser only the cells that change
+            self.update_status_table()
+            self.update_universe_table()
 
     def main(self):
 
@@ -198,6 +204,9 @@ class Flamecaster(App):
         self.statusPanel = StatusContainer()
         # get a reference to the table in the screen1 Widget
         self.status_table = self.statusPanel.children['status_table']
+        self.statusRows = []
+        self.universe_table = self.statusPanel.children['universe_table']
+        self.universeRows = []
 
         self.systemPanel = SystemSettingsContainer()
         self.systemPanel.set_system_text(pd.editableConfig.get('system', {}))
@@ -261,10 +270,8 @@ class Flamecaster(App):
         return decode_address_int(highestUniverse + 1)
 
     def on_close(self):
-        # deactivate the UI flag and empty the data queue
+        # deactivate the UI flag
         pd.ui_is_active.clear()
-        while not pd.dataQueue.empty():
-            pd.dataQueue.get()
 
         super(Flamecaster, self).on_close()
 
@@ -347,35 +354,68 @@ class Flamecaster(App):
 
         data[uTag][key] = new_value
 
-    def fill_status_table(self):
-        """ add information from the devices section of configDatabase to the status panel's
-        main table.
+    def update_status_table(self):
+        """ Bring the status panel's main table up to date with the latest device status.  Only
+        rows whose displayed values have changed are rewritten.
         """
-
-        lastRow = 2 + len(self.devices)
-        for n in range(5):
-            self.status_table.item_at(0, n).style['height'] = uiTextHeight
-            self.status_table.item_at(lastRow, n).set_text("  ")
-
-        for i, key in enumerate(self.devices):
+        rows = []
+        for key in self.devices:
+            db = self.devices[key]
+            rows.append((key,
+                         str(db.get('ip', '')),
+                         str(db.get('inPps', 0)),
+                         str(db.get('outFps', 0)),
+                         "Yes" if db.get('connected', False) else "No",
+                         "Idle" if db.get('state', "active") == "idle" else "Active"))
+
+        self.statusRows = self.update_table(self.status_table, rows, self.statusRows)
+        # (remi only sends styles that actually change)
+        for i, row in enumerate(rows):
+            self.status_table.item_at(i + 1, 4).css_color = "rgb(0,0,0)" if row[4] == "Yes" else "rgb(255,0,0)"
+
+    def update_universe_table(self):
+        """ Bring the status panel's universe table up to date with the latest packet counts.  Only
+        rows whose displayed values have changed are rewritten.
+        """
+        rows = []
+        for key in sorted(self.universeStats, key=int):
+            us = self.universeStats[key]
+            rows.append(("%d:%d:%d" % (us.get('net', 0), us.get('subnet', 0), us.get('universe', 0)),
+                         "%d" % us.get('received', 0),
+                         "%d" % us.get('reordered', 0),
+                         "%d" % us.get('duplicated', 0),
+                         "%d" % us.get('lost', 0)))
+        self.universeRows = self.update_table(self.universe_table, rows, self.universeRows)
+
+    @staticmethod
+    def update_table(table, rows: list, shown: list) -> list:
+        """ Write rows of text to a status table, skipping rows that haven't changed.
+        :param table: the table to update
+        :param rows: list of tuples of cell text, one per row
+        :param shown: the rows the table is showing now, as returned by the last update
+        :return: the rows the table is showing after the update
+        """
+        # resize the table when the number of rows changes.  The top row holds the labels, and
+        # the two rows after the data are blank.  The bottom one expands to fill any
+        # remaining space in the panel.
+        if len(rows) != len(shown):
+            table.set_row_count(3 + len(rows))
+            shown = shown[:len(rows)]
+            for i in (len(rows) + 1, len(rows) + 2):
+                for n in range(table.column_count):
+                    table.item_at(i, n).set_text("  ")
+
+        for i, row in enumerate(rows):
+            if i < len(shown) and shown[i] == row:
+                continue
 
             # the first row is reserved for the column headers
-            i = i + 1
-            db = self.devices[key]
-            self.status_table.item_at(i, 0).set_text(key)
-            self.status_table.item_at(i, 1).set_text(str(db.get('ip', '')))
-            self.status_table.item_at(i, 2).set_text(str(db.get('inPps', 0)))
-            self.status_table.item_at(i, 3).set_text(str(db.get('outFps', 0)))
-
-            if db.get('connected', "false") == "true":
-                self.status_table.item_at(i, 4).css_color = "rgb(0,0,0)"
-                self.status_table.item_at(i, 4).set_text("Yes")
-            else:
-                self.status_table.item_at(i, 4).css_color = "rgb(255,0,0)"
-                self.status_table.item_at(i, 4).set_text("No")
+            for n, text in enumerate(row):
+                item = table.item_at(i + 1, n)
+                item.set_text(text)
+                item.style['height'] = uiTextHeight
 
-            for n in range(5):
-                self.status_table.item_at(i, n).style['height'] = uiTextHeight
+        return rows
 
     def start_universe_editor(self):
         """Switch to the universes panel.  If it's already showing, do nothing."""
@@ -553,12 +593,13 @@ class Flamecaster(App):
 
     def menu_save_clicked(self, emitter):
         pd.saveProject()
-        restartArtnetRouter(pd)
+        pd.loadProject()
+        reloadArtnetRouter(pd)
         pass
 
     def menu_reload_clicked(self, emitter):
         pd.revertToSaved()
-        restartArtnetRouter(pd)
+        reloadArtnetRouter(pd)
         pass
 
     def menu_exit_clicked(self, emitter):
@@ -28,7 +28,9 @@
 
 import errno
 import json
+import select
 import socket
+import sys
 from enum import Flag, IntEnum
 from typing import Union
 
@@ -36,6 +38,15 @@ import websocket
 
 from ArtnetUtils import clamp, time_in_millis
 
+# Linux lets us ask how much data is still waiting in a TCP socket's send queue.
+if sys.platform.startswith("linux"):
+    import fcntl
+    import struct
+    import termios
+    SIOCOUTQ = termios.TIOCOUTQ
+else:
+    SIOCOUTQ = None
+
 
 # --- MAIN CLASS
 # noinspection PyBroadException
@@ -50,8 +61,12 @@ class Pixelblaze:
     # --- PRIVATE DATA
     default_recv_timeout = 1
     default_open_interval = 2000  # milliseconds
+    default_connect_timeout = 2  # seconds
+    default_close_timeout = 0.05  # seconds to wait for the Pixelblaze to acknowledge a close
     ws = None
     connected = False
+    sendBufferSize = 0
+    pendingSocket = None
     ipAddress = None
 
     # Pattern cache
@@ -69,7 +84,7 @@ class Pixelblaze:
 
     # --- OBJECT LIFETIME MANAGEMENT (CREATION/DELETION)
 
-    def __init__(self, ipAddress: str):
+    def __init__(self, ipAddress: str, sendBufferSize: int = 0, connect: bool = True):
         """Initializes an object for communicating with and controlling a Pixelblaze.
 
            Doesn't require the Pixelblaze to be active or connected at the time of creation.
@@ -78,14 +93,20 @@ class Pixelblaze:
         Args:
             ipAddress (str): The Pixelblaze's IPv4 address in the usual dotted-quads numeric format
              (for example, "192.168.4.1").
+            sendBufferSize (int, optional): Size of the socket's send buffer, in bytes.  A small buffer
+             keeps stale frames from piling up on a slow link.  Defaults to 0, which uses the OS default.
+            connect (bool, optional): If True, make the first (blocking) attempt to open the connection
+             right away.  If False, the caller will open it later, with open() or beginOpen().  Defaults to True.
         """
         self.ipAddress = ipAddress
+        self.sendBufferSize = sendBufferSize
         self.setCacheRefreshTime(600)  # seconds used in public api
 
-        try:
-            self.open()
-        except Exception:
-            pass
+        if connect:
+            try:
+                self.open()
+            except Exception:
+                pass
 
     def __enter__(self):
         """Internal class method for resource management.
@@ -123,37 +144,145 @@ class Pixelblaze:
         # only retry opens every 2 seconds at most
         if time_in_millis() - self.lastOpenAttempt > self.default_open_interval:
             self.lastOpenAttempt = time_in_millis()
-            uri = "ws://" + self.ipAddress + ":81"
 
             try:
                 self.ws = websocket.create_connection(
-                    uri,
+                    self._uri(),
                     skip_utf8_validation=True,
-                    sockopt=(
-                        (socket.SOL_SOCKET, socket.SO_REUSEADDR, 1),
-                        (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
-                    ),
+                    timeout=self.default_connect_timeout,
+                    sockopt=tuple(self._sockopts()),
                 )
 
             except websocket._exceptions.WebSocketConnectionClosedException:
                 raise
 
-            self.ws.settimeout(self.default_recv_timeout)
-            self.connected = True
+            self._finish_open()
+
+    def _uri(self) -> str:
+        return "ws://" + self.ipAddress + ":81"
+
+    def _sockopts(self) -> list:
+        """Returns the socket options we use for the websocket connection."""
+        sockopt = [
+            (socket.SOL_SOCKET, socket.SO_REUSEADDR, 1),
+            (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+        ]
+        if self.sendBufferSize > 0:
+            sockopt.append((socket.SOL_SOCKET, socket.SO_SNDBUF, self.sendBufferSize))
+        return sockopt
+
+    def _finish_open(self):
+        """Set up a newly opened websocket connection."""
+        self.ws.settimeout(self.default_recv_timeout)
+        self.connected = True
+
+        # Reset our caches so we'll get them afresh.
+        self.latestStats = None
+        self.latestConfig = None
+        self.latestSequencer = None
+
+        self.requestConfigSettings()
+
+    def beginOpen(self):
+        """
+        Start a non-blocking TCP connection to the Pixelblaze.  Call pollOpen() to find out
+        how it went, and to finish opening the websocket once the TCP connection is up.
+        """
+        if self.connected or self.pendingSocket is not None:
+            return
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        for level, option, value in self._sockopts():
+            sock.setsockopt(level, option, value)
+        sock.setblocking(False)
+
+        err = sock.connect_ex((self.ipAddress, 81))
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, 10035):
+            sock.close()
+            raise OSError(err, "Connect to %s failed" % self.ipAddress)
+        self.pendingSocket = sock
+
+    def is_connecting(self) -> bool:
+        """Returns True if a non-blocking connection attempt is in progress."""
+        return self.pendingSocket is not None
+
+    def pollOpen(self) -> bool:
+        """
+        Check on a connection attempt started by beginOpen().  Doesn't wait for the TCP
+        connection.  Once it's up, does the (short) websocket handshake.
+
+        Returns:
+            bool: True if the connection is open, False if it's still in progress.
+
+        Raises:
+            OSError: if the connection attempt failed.
+        """
+        if self.connected:
+            return True
+        sock = self.pendingSocket
+        if sock is None:
+            return False
+
+        _, writable, failed = select.select([], [sock], [sock], 0)
+        if not writable and not failed:
+            return False
+
+        self.pendingSocket = None
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err != 0:
+            sock.close()
+            raise OSError(err, "Connect to %s failed" % self.ipAddress)
+
+        # the Pixelblaze is there, so the handshake should be quick.
+        sock.setblocking(True)
+        sock.settimeout(self.default_connect_timeout)
+        try:
+            self.ws = websocket.create_connection(
+                self._uri(),
+                skip_utf8_validation=True,
+                timeout=self.default_connect_timeout,
+                socket=sock,
+            )
+        except Exception:
+            sock.close()
+            raise
 
-            # Reset our caches so we'll get them afresh.
-            self.latestStats = None
-            self.latestConfig = None
-            self.latestSequencer = None
+        self._finish_open()
+        return True
 
-            self.requestConfigSettings()
+    def cancelOpen(self):
+        """Abandon a connection attempt started by beginOpen()."""
+        if self.pendingSocket is not None:
+            self.pendingSocket.close()
+            self.pendingSocket = None
 
-    def close(self):
-        """Close websocket connection."""
+    def close(self, graceful: bool = True):
+        """Close websocket connection.
+
+        Args:
+            graceful (bool, optional): If True, send a close frame and give the Pixelblaze a moment
+             to acknowledge it.  If False, just drop the connection without writing anything, which
+             never blocks.  Defaults to True.
+        """
+        self.cancelOpen()
         if self.connected is True:
-            self.ws.close()
+            if graceful:
+                self.ws.close(timeout=self.default_close_timeout)
+            else:
+                self.ws.shutdown()
             self.connected = False
 
+    def getSendQueueBytes(self) -> int:
+        """Returns the number of bytes waiting in the websocket's TCP send queue, or 0
+        if the connection is closed or the platform can't tell us."""
+        if SIOCOUTQ is None or not self.connected:
+            return 0
+        try:
+            buf = fcntl.ioctl(self.ws.sock.fileno(), SIOCOUTQ, b"\0\0\0\0")
+            return struct.unpack("i", buf)[0]
+        except (OSError, AttributeError, ValueError):
+            return 0
+
     # --- LOW-LEVEL SEND/RECEIVE
 
     class MessageTypes(IntEnum):
@@ -200,19 +329,9 @@ class Pixelblaze:
 
         frame = self.ws.recv()
         if type(frame) is str:
-            # Some frames are sent unrequested and often interrupt the conversation; we'll just
-            # save the most recent one and retrieve it later when we want it.
-            if frame.startswith('{"fps":'):
-                self.latestStats = frame
-                if binaryMessageType is self.MessageTypes.specialStats:
-                    return frame
-            elif frame.startswith('{"activeProgram":'):
-                self.latestSequencer = frame
-                if binaryMessageType is self.MessageTypes.specialConfig:
-                    return frame
-            elif frame.startswith('{"name":'):
-                self.latestConfig = frame
-                if binaryMessageType is self.MessageTypes.specialConfig:
+            kind = self.saveTextMessage(frame)
+            if kind is not None:
+                if binaryMessageType is kind:
                     return frame
             # We wanted a text frame, we got a text frame.
             elif binaryMessageType is None:
@@ -245,6 +364,30 @@ class Pixelblaze:
                         return message
                 return message
 
+    def saveTextMessage(self, frame: str) -> Union[MessageTypes, None]:
+        """Save a text message of the kinds the Pixelblaze sends unrequested.
+
+        Some frames are sent unrequested and often interrupt the conversation; we'll just
+        save the most recent one and retrieve it later when we want it.
+
+        Args:
+            frame (str): The message received from the Pixelblaze.
+
+        Returns:
+            Union[MessageTypes, None]: The special message type it was saved as, or None if it
+            wasn't one of those.
+        """
+        if frame.startswith('{"fps":'):
+            self.latestStats = frame
+            return self.MessageTypes.specialStats
+        elif frame.startswith('{"activeProgram":'):
+            self.latestSequencer = frame
+            return self.MessageTypes.specialConfig
+        elif frame.startswith('{"name":'):
+            self.latestConfig = frame
+            return self.MessageTypes.specialConfig
+        return None
+
     def sendPing(self):
         """Send a Ping message to the Pixelblaze and wait for the Acknowledgement response.
 